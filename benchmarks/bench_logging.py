@@ -0,0 +1,97 @@
+"""
+Records/sec of logsetup.JsonFormatter against the formatter it replaced,
+on the shapes of line the API and shipper log most.
+
+    python benchmarks/bench_logging.py --records 200000
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+from datetime import datetime, timezone
+from functools import partial
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import logsetup  # noqa: E402
+
+
+class LegacyJsonFormatter(logging.Formatter):
+    """JsonFormatter as it was before the timestamp cache and field parsing."""
+
+    def format(self, record):
+        doc = {
+            "@timestamp": datetime.now(timezone.utc).isoformat(),
+            "log.level": record.levelname.lower(),
+            "message": record.getMessage(),
+            "logger": record.name,
+        }
+        return json.dumps(doc, ensure_ascii=False)
+
+
+def make_records():
+    samples = [
+        (
+            "action=db.query_one component=db outcome=success found=%s pool_wait_ms=%.1f pool_in_use=%s pool_size=%s duration_ms=%.1f",
+            (True, 0.02, 1, 4, 1.37),
+        ),
+        (
+            "action=docs.generate component=api outcome=%s status=200 schema=%s count=%s sent=%s seed=%s offset=%s mime=%s first_byte_ms=%.1f duration_ms=%.1f",
+            ("success", "Esports", 1000, 1000, None, 0, "ndjson", 3.2, 41.9),
+        ),
+        (
+            "action=bulk.upload component=loader outcome=success index=%s attempt=%s errors=%s docs=%s bytes=%s bulk_size=%s docs_per_s=%.1f duration_ms=%.1f",
+            ("pro_players", 0, False, 500, 412345, 625, 18234.2, 27.4),
+        ),
+    ]
+    return [
+        logging.LogRecord("bench", logging.INFO, __file__, 0, msg, args, None)
+        for msg, args in samples
+    ]
+
+
+def run(formatter, records, count):
+    time_start = time.perf_counter()
+    for i in range(count):
+        formatter.format(records[i % len(records)])
+    return count / (time.perf_counter() - time_start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--records", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    records = make_records()
+    formatters = {"legacy": LegacyJsonFormatter()}
+    if logsetup.orjson is not None:
+        formatters["orjson"] = logsetup.JsonFormatter()
+    formatters["stdlib"] = logsetup.JsonFormatter()
+
+    results = {}
+    for name, formatter in formatters.items():
+        ### the stdlib run swaps the encoder for the one used without orjson
+        logsetup.encode_json = (
+            partial(json.dumps, ensure_ascii=False, default=str)
+            if name == "stdlib"
+            else ENCODE_JSON
+        )
+        results[name] = max(
+            run(formatter, records, args.records) for _ in range(args.repeat)
+        )
+        print(f"{name:>7}: {results[name]:>10.0f} records/s")
+    logsetup.encode_json = ENCODE_JSON
+
+    for name in formatters:
+        if name != "legacy":
+            print(f"{name} vs legacy: {results[name] / results['legacy']:.2f}x")
+
+
+ENCODE_JSON = logsetup.encode_json
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+Compare the shipper's document sources without Elasticsearch: NDJSON over
+HTTP from a local werkzeug server (api) against in-process generation
+(local) and the generation pool (pool). Each run drains the source through
+iter_bulk_chunks, so the numbers cover everything up to the bulk request.
+
+    python benchmarks/bench_shipper.py --count 200000 --workers 4
+"""
+
+import argparse
+import json
+import os
+import threading
+import time
+
+### common first: it sets up sys.path, the environment and db.DB for the rest
+import common  # noqa: F401
+
+import data_shipper
+import genpool
+import miniproject2
+from werkzeug.serving import make_server
+
+
+def serve():
+    miniproject2.db.schemas[data_shipper.SCHEMA_NAME] = data_shipper.SCHEMA_FIELDS
+    server = make_server("127.0.0.1", 0, miniproject2.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_port}"
+
+
+def drain(source):
+    docs = 0
+    size = 0
+    time_start = time.perf_counter()
+    for body, count in data_shipper.iter_bulk_chunks(source()):
+        docs += count
+        size += len(body)
+    return docs, size, time.perf_counter() - time_start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--count", type=int, default=100000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    data_shipper.COUNT = args.count
+    data_shipper.GEN_ENDPOINT = f"{serve()}/generate-documents"
+    data_shipper.SCHEMA_FILE = None
+    genpool.GEN_POOL_THRESHOLD = 0
+
+    sources = {
+        "api": (data_shipper.fetch_doc_lines, 0),
+        "local": (data_shipper.generate_doc_lines, 0),
+        "pool": (data_shipper.generate_doc_lines, args.workers),
+    }
+    results = {}
+    for name, (source, workers) in sources.items():
+        genpool.GEN_POOL_WORKERS = workers
+        best = None
+        for _ in range(args.repeat):
+            docs, size, seconds = drain(source)
+            best = seconds if best is None else min(best, seconds)
+        results[name] = {
+            "docs": docs,
+            "bytes": size,
+            "seconds": round(best, 3),
+            "docs_per_s": round(docs / best),
+        }
+        print(name, json.dumps(results[name]), flush=True)
+    genpool.shutdown()
+
+    for name in ("local", "pool"):
+        print(
+            f"{name} vs api: {results['api']['seconds'] / results[name]['seconds']:.2f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
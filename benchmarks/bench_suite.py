@@ -0,0 +1,173 @@
+"""
+Throughput of the per-type generators, make_document, /generate-documents
+and bulk body building, written as JSON and optionally checked against a
+saved baseline (exit status 1 when anything regressed).
+
+    python benchmarks/bench_suite.py --output baseline.json
+    python benchmarks/bench_suite.py --baseline baseline.json --threshold 0.1
+"""
+
+import argparse
+import json
+import os
+import platform
+import sys
+from datetime import datetime, timezone
+
+### common first: it sets up sys.path, the environment and db.DB for the rest
+import common
+
+import data_shipper
+import generators
+import miniproject2
+import serializer
+
+SCHEMA = data_shipper.SCHEMA_FIELDS
+
+
+def generator_cases():
+    ### one call per value; role/org/trophies read the game from the document
+    document = {"game": "cs2"}
+    calls = {
+        "integer": lambda: generators.generate_integer(SCHEMA["id"]),
+        "name.full": lambda: generators.generate_name(SCHEMA["name"]),
+        "name.gamertag": lambda: generators.generate_name(SCHEMA["nickname"]),
+        "dob": lambda: generators.generate_dob(SCHEMA["dob"]),
+        "ip": lambda: generators.generate_ip({"type": "ip"}),
+        "country": lambda: generators.generate_country(SCHEMA["country_code"]),
+        "game": lambda: generators.generate_game(SCHEMA["game"]),
+        "role": lambda: generators.generate_role(SCHEMA["role"], document, "game"),
+        "org": lambda: generators.generate_org(SCHEMA["org"], document, "game"),
+        "trophies": lambda: generators.generate_trophies(
+            SCHEMA["trophies"], document, "game"
+        ),
+    }
+    return {
+        f"generate.{name}": (function, 1, "values") for name, function in calls.items()
+    }
+
+
+def document_cases():
+    plan = generators.compile_schema(SCHEMA)
+    return {
+        "make_document.esports": (lambda: generators.make_document(plan), 1, "docs"),
+        "make_documents.esports.1000": (
+            lambda: generators.make_documents(plan, 1000),
+            1000,
+            "docs",
+        ),
+    }
+
+
+def endpoint_cases(counts):
+    miniproject2.db.schemas[data_shipper.SCHEMA_NAME] = SCHEMA
+    client = miniproject2.app.test_client()
+
+    def post(count, accept):
+        response = client.post(
+            "/generate-documents",
+            json={"schema_name": data_shipper.SCHEMA_NAME, "count": count},
+            headers={"Accept": accept},
+        )
+        ### reading the body runs the stream; closing it ends the request's metrics
+        response.get_data()
+        response.close()
+
+    cases = {}
+    for count in counts:
+        for mime, accept in (
+            ("json", "application/json"),
+            ("ndjson", "application/x-ndjson"),
+        ):
+            cases[f"api.generate_documents.{mime}.{count}"] = (
+                lambda count=count, accept=accept: post(count, accept),
+                count,
+                "docs",
+            )
+    return cases
+
+
+def bulk_cases(docs):
+    plan = generators.compile_schema(SCHEMA)
+    lines = plan.template().lines(generators.make_rows(plan, docs))
+    doc_ndjson = b"\n".join(lines).decode()
+    return {
+        f"build_bulk_body.{docs}": (
+            lambda: data_shipper.build_bulk_body(doc_ndjson),
+            docs,
+            "docs",
+        ),
+        f"bulk_body.{docs}": (lambda: data_shipper.bulk_body(lines), docs, "docs"),
+    }
+
+
+def run(cases, repeat):
+    results = {}
+    for name, (function, units, unit) in cases.items():
+        seconds = common.measure(function, repeat)
+        results[name] = {
+            "unit": unit,
+            "per_s": round(units / seconds, 1),
+            "seconds": seconds,
+        }
+        print(f"{name:<40} {results[name]['per_s']:>14,.0f} {unit}/s", flush=True)
+    return results
+
+
+def report(rows):
+    regressions = 0
+    print(f"\n{'benchmark':<40} {'per_s':>14} {'baseline':>14} {'change':>8}")
+    for name, per_s, before, change, flag in rows:
+        before = "-" if before is None else f"{before:,.0f}"
+        change = "-" if change is None else f"{change:+.1%}"
+        print(f"{name:<40} {per_s:>14,.0f} {before:>14} {change:>8} {flag}")
+        regressions += flag == "regression"
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--counts", default="10,1000,10000")
+    parser.add_argument("--bulk-docs", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--only", help="run benchmarks whose name contains this")
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--baseline", help="results file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.1)
+    args = parser.parse_args()
+
+    cases = {
+        **generator_cases(),
+        **document_cases(),
+        **endpoint_cases([int(count) for count in args.counts.split(",")]),
+        **bulk_cases(args.bulk_docs),
+    }
+    if args.only:
+        cases = {name: case for name, case in cases.items() if args.only in name}
+
+    results = run(cases, args.repeat)
+    with open(args.output, "w") as f:
+        json.dump(
+            {
+                "created": datetime.now(timezone.utc).isoformat(),
+                "python": platform.python_version(),
+                "orjson": serializer.orjson is not None,
+                "cpus": os.cpu_count(),
+                "results": results,
+            },
+            f,
+            indent=2,
+        )
+    print(f"\nwrote {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+        regressions = report(common.compare(results, baseline, args.threshold))
+        if regressions:
+            print(f"\n{regressions} regression(s) beyond {args.threshold:.0%}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
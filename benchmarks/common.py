@@ -0,0 +1,63 @@
+"""
+Shared setup for the benchmarks. Importing it puts the repo root on
+sys.path, points the shipper at unreachable hosts, and swaps db.DB for
+MemoryDB so miniproject2 can be imported without MySQL.
+"""
+
+import json
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("API_URL", "http://127.0.0.1:9")
+os.environ.setdefault("ES_URL", "http://127.0.0.1:9")
+os.environ.setdefault("ES_PASS", "")
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+import db  # noqa: E402
+
+
+class MemoryDB:
+    """Stands in for db.DB: schemas live in a dict of name -> field map."""
+
+    def __init__(self):
+        self.schemas = {}
+        self.hooks = []
+
+    def init_schema(self):
+        pass
+
+    def query_one(self, sql, params=None):
+        fields = self.schemas.get(params[0])
+        if fields is None:
+            return None
+        return {"id": 1, "fields": json.dumps(fields), "updated_at": 0}
+
+
+db.DB = MemoryDB
+
+
+def measure(function, repeat=3):
+    """Best seconds per call of function() over `repeat` runs of at least 0.2s."""
+    timer = timeit.Timer(function)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat, number)) / number
+
+
+def compare(results, baseline, threshold):
+    """
+    Rows of (name, per_s, baseline per_s, change, flag) for every result,
+    flag being "regression" when throughput dropped by more than threshold
+    (0.1 = 10%), "new" when the baseline has no such benchmark.
+    """
+    rows = []
+    for name, result in results.items():
+        before = baseline.get(name)
+        if before is None:
+            rows.append((name, result["per_s"], None, None, "new"))
+            continue
+        change = result["per_s"] / before["per_s"] - 1
+        flag = "regression" if change < -threshold else ""
+        rows.append((name, result["per_s"], before["per_s"], change, flag))
+    return rows
@@ -1,9 +1,24 @@
 import requests
-from elasticsearch import Elasticsearch
+from requests.adapters import HTTPAdapter
+from elasticsearch import Elasticsearch, ApiError, ConnectionTimeout
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import partial
+import asyncio
 import json
+import random
+import signal
+import sys
+import threading
 import time
 import os
 from dotenv import load_dotenv
+from db import DB
+from generators import compile_schema, process_fields
+import genpool
+from spool import Spool
+import metrics
+import serializer
 from logsetup import setup_logging, get_logger
 
 load_dotenv()
@@ -15,41 +30,202 @@ SCHEMA_ENDPOINT = f"{API_URL}/schemas"
 GEN_ENDPOINT = f"{API_URL}/generate-documents"
 
 SCHEMA_NAME = "Esports"
+SCHEMA_FIELDS = {
+    "nickname": {"type": "name", "format": "gamertag"},
+    "name": {"type": "name", "format": "full"},
+    "id": {"type": "integer", "min": 1, "max": 100000},
+    "dob": {"type": "dob", "min": 18, "max": 32},
+    "country_code": {"type": "country", "format": "alpha2"},
+    "game": {"type": "game"},
+    "role": {"type": "role"},
+    "org": {"type": "org"},
+    "trophies": {"type": "trophies", "min": 1, "max": 20, "start_year": 2020},
+}
 COUNT = int(os.environ.get("COUNT", "100"))
 INTERVAL = int(os.environ.get("INTERVAL", "10"))
 
+### api: fetch NDJSON from /generate-documents; db: read the schema from MySQL and
+### generate in-process; file: same, from SCHEMA_FILE (a POST /schemas body) or,
+### if unset, SCHEMA_FIELDS. Local generation uses the GEN_POOL_* settings.
+SHIPPER_SOURCES = ("api", "db", "file")
+SHIPPER_SOURCE = os.environ.get("SHIPPER_SOURCE", "api")
+if SHIPPER_SOURCE not in SHIPPER_SOURCES:
+    raise ValueError(
+        f"SHIPPER_SOURCE must be one of {SHIPPER_SOURCES}, got {SHIPPER_SOURCE!r}"
+    )
+SCHEMA_FILE = os.environ.get("SCHEMA_FILE")
+GEN_BATCH_SIZE = int(os.environ.get("GEN_BATCH_SIZE", "1000"))
+
+### interval: fetch, index, sleep INTERVAL; pipeline: asyncio fetchers and indexers
+### joined by a bounded queue, running as fast as ES accepts batches
+SHIPPER_MODE = os.environ.get("SHIPPER_MODE", "interval")
+FETCH_CONCURRENCY = int(os.environ.get("FETCH_CONCURRENCY", "2"))
+BULK_CONCURRENCY = int(os.environ.get("BULK_CONCURRENCY", "2"))
+QUEUE_SIZE = int(os.environ.get("QUEUE_SIZE", "4"))
+STATS_INTERVAL = int(os.environ.get("STATS_INTERVAL", "30"))
+
+### keep-alive connections to the API, one per concurrent fetch
+SESSION = requests.Session()
+SESSION.mount("http://", HTTPAdapter(pool_maxsize=FETCH_CONCURRENCY))
+SESSION.mount("https://", HTTPAdapter(pool_maxsize=FETCH_CONCURRENCY))
+
 ES_URL = os.environ.get("ES_URL")
 ES_USER = "elastic"
 ES_PASS = os.environ.get("ES_PASS")
 ES_INDEX = "pro_players"
 ES_VERIFY_CERTS = False
+### bulk requests are cut at whichever limit is hit first; keep BULK_MAX_BYTES well
+### under the cluster's http.max_content_length
+BULK_MAX_DOCS = int(os.environ.get("BULK_MAX_DOCS", "1000"))
+BULK_MAX_BYTES = int(os.environ.get("BULK_MAX_BYTES", str(5 * 1024 * 1024)))
+### the doc limit adapts between BULK_MIN_DOCS and BULK_MAX_DOCS, aiming for bulks
+### that finish within BULK_TARGET_MS
+BULK_MIN_DOCS = int(os.environ.get("BULK_MIN_DOCS", "100"))
+BULK_START_DOCS = int(os.environ.get("BULK_START_DOCS", "500"))
+BULK_TARGET_MS = float(os.environ.get("BULK_TARGET_MS", "1000"))
+### wait_for: every bulk blocks until a refresh; none: leave it to the index's
+### refresh_interval; interval: explicit refresh at most every BULK_REFRESH_PERIOD s
+BULK_REFRESH = os.environ.get("BULK_REFRESH", "wait_for")
+BULK_REFRESH_PERIOD = float(os.environ.get("BULK_REFRESH_PERIOD", "30"))
+### set refresh_interval to -1 for the run and restore it on exit; wait_for is then
+### ignored, as with nothing refreshing the index every bulk would wait until timeout
+BULK_DISABLE_REFRESH = os.environ.get("BULK_DISABLE_REFRESH", "false").lower() == "true"
+### items rejected with these statuses are retried; 0 is a request that never
+### reached ES. A timed-out request gets TIMEOUT_STATUS and is not retried: ES may
+### have indexed it, and index actions without an _id would be duplicated
+RETRY_STATUSES = {0, 429, 502, 503, 504}
+TIMEOUT_STATUS = 408
+BULK_RETRIES = int(os.environ.get("BULK_RETRIES", "5"))
+BULK_BACKOFF_MS = float(os.environ.get("BULK_BACKOFF_MS", "200"))
+BULK_BACKOFF_MAX_MS = float(os.environ.get("BULK_BACKOFF_MAX_MS", "10000"))
+DEAD_LETTER_FILE = os.environ.get("DEAD_LETTER_FILE", "dead_letter.ndjson")
+### with SPOOL_DIR set, fetched chunks are appended to an on-disk spool that the
+### indexers drain at their own pace; chunks survive ES outages and restarts
+SPOOL_DIR = os.environ.get("SPOOL_DIR")
+SPOOL_MAX_BYTES = int(os.environ.get("SPOOL_MAX_BYTES", str(1024 * 1024 * 1024)))
+SPOOL_SEGMENT_BYTES = int(os.environ.get("SPOOL_SEGMENT_BYTES", str(64 * 1024 * 1024)))
+SPOOL_FSYNC = os.environ.get("SPOOL_FSYNC", "interval")
+SPOOL_FSYNC_INTERVAL = float(os.environ.get("SPOOL_FSYNC_INTERVAL", "1"))
+SPOOL_RETRY_INTERVAL = float(os.environ.get("SPOOL_RETRY_INTERVAL", "5"))
+### Prometheus text on METRICS_HOST:METRICS_PORT/metrics (0 disables), plus a
+### summary log line every METRICS_LOG_INTERVAL seconds
+METRICS_HOST = os.environ.get("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.environ.get("METRICS_PORT", "9108"))
+METRICS_LOG_INTERVAL = float(os.environ.get("METRICS_LOG_INTERVAL", "60"))
+ACTION_LINE = json.dumps({"index": {"_index": ES_INDEX}})
+ACTION_BYTES = (ACTION_LINE + "\n").encode()
 ES = Elasticsearch(
     ES_URL,
     basic_auth=(ES_USER, ES_PASS),
     verify_certs=ES_VERIFY_CERTS,
     ssl_show_warn=not ES_VERIFY_CERTS,
     request_timeout=30,
+    connections_per_node=BULK_CONCURRENCY,
+)
+
+
+class BulkSizer:
+    """
+    Latency-driven control of the bulk doc limit. Bulks that finish under
+    half the target grow the limit by a quarter plus one, slow ones shrink
+    it by a fifth, and 429s or rejected items halve it. The result is kept
+    between min_size and max_size.
+    """
+
+    def __init__(self, size, min_size, max_size, target_ms):
+        self.min_size = min_size
+        self.max_size = max_size
+        self.target_ms = target_ms
+        self.size = min(max(size, min_size), max_size)
+        self.lock = threading.Lock()
+
+    def record(self, duration_ms, rejected=0):
+        with self.lock:
+            if rejected:
+                size = self.size // 2
+            elif duration_ms > self.target_ms:
+                size = int(self.size * 0.8)
+            elif duration_ms < self.target_ms / 2:
+                size = int(self.size * 1.25) + 1
+            else:
+                size = self.size
+            self.size = min(max(size, self.min_size), self.max_size)
+            return self.size
+
+
+SIZER = BulkSizer(BULK_START_DOCS, BULK_MIN_DOCS, BULK_MAX_DOCS, BULK_TARGET_MS)
+
+DOCS = metrics.REGISTRY.counter(
+    "shipper_docs_total", "Documents by outcome.", ["outcome"]
 )
+BYTES = metrics.REGISTRY.counter("shipper_bytes_total", "Bytes by phase.", ["phase"])
+ERRORS = metrics.REGISTRY.counter("shipper_errors_total", "Errors by phase.", ["phase"])
+PHASE_SECONDS = metrics.REGISTRY.histogram(
+    "shipper_phase_seconds", "Duration of each phase.", ["phase"]
+)
+IN_FLIGHT = metrics.REGISTRY.gauge(
+    "shipper_in_flight", "Fetches and bulk requests in progress.", ["phase"]
+)
+QUEUE_DEPTH = metrics.REGISTRY.gauge(
+    "shipper_queue_depth", "Bulk chunks waiting to be indexed."
+)
+BULK_SIZE = metrics.REGISTRY.gauge("shipper_bulk_size", "Current bulk doc limit.")
+BULK_SIZE.set_function(lambda: SIZER.size)
+
+
+class SourceTimer:
+    """
+    Times a document source only while it produces lines: the source
+    pauses the timer before each yield and resumes it after, so the time
+    its consumer holds a line (building, queueing or sending bulks) is left
+    out. Running timers make up the source phases of the in-flight gauge.
+    """
+
+    active = set()
+
+    def __init__(self, phase):
+        self.phase = phase
+        self.busy_s = 0.0
+        self.running = False
+        self.resumed = 0.0
+
+    def __enter__(self):
+        SourceTimer.active.add(self)
+        self.resume()
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.running:
+            self.pause()
+        SourceTimer.active.discard(self)
+        return False
+
+    def resume(self):
+        self.running = True
+        self.resumed = time.monotonic()
+
+    def pause(self):
+        self.busy_s += time.monotonic() - self.resumed
+        self.running = False
+
+    @classmethod
+    def in_flight(cls, phase):
+        return sum(timer.running for timer in list(cls.active) if timer.phase == phase)
+
+
+for phase in ("docs.fetch", "docs.generate"):
+    IN_FLIGHT.set_function(partial(SourceTimer.in_flight, phase), phase=phase)
+last_refresh = time.monotonic()
+refresh_lock = threading.Lock()
+dead_letter_lock = threading.Lock()
+spool = None
 
 
 def create_schema():
-    body = {
-        "schema_name": SCHEMA_NAME,
-        "fields": {
-            "nickname": {"type": "name", "format": "gamertag"},
-            "name": {"type": "name", "format": "full"},
-            "id": {"type": "integer", "min": 1, "max": 100000},
-            "dob": {"type": "dob", "min": 18, "max": 32},
-            "country_code": {"type": "country", "format": "alpha2"},
-            "game": {"type": "game"},
-            "role": {"type": "role"},
-            "org": {"type": "org"},
-            "trophies": {"type": "trophies", "min": 1, "max": 20, "start_year": 2020},
-        },
-    }
+    body = {"schema_name": SCHEMA_NAME, "fields": SCHEMA_FIELDS}
     time_start = time.monotonic()
     try:
-        r = requests.post(SCHEMA_ENDPOINT, json=body, timeout=20)
+        r = SESSION.post(SCHEMA_ENDPOINT, json=body, timeout=20)
         time_diff = (time.monotonic() - time_start) * 1000
         if r.status_code == 201:
             log.info(
@@ -78,32 +254,139 @@ def create_schema():
         )
 
 
-def fetch_docs_raw():
+def fetch_doc_lines():
+    """
+    Stream the generated NDJSON and yield each non-empty line as bytes, so
+    the batch is never held in memory as a whole. Logs once the stream ends;
+    durations count only the time spent reading it (see SourceTimer).
+    """
     headers = {"Accept": "application/x-ndjson"}
     payload = {"schema_name": SCHEMA_NAME, "count": COUNT}
-    time_start = time.monotonic()
+    timer = SourceTimer("docs.fetch")
+    lines = 0
+    size = 0
     try:
         log.debug(
             "action=docs.fetch component=loader request=POST endpoint=%s count=%s",
             GEN_ENDPOINT,
             COUNT,
         )
-        r = requests.post(GEN_ENDPOINT, json=payload, headers=headers, timeout=20)
-        r.raise_for_status()
-        time_diff = (time.monotonic() - time_start) * 1000
+        with timer, SESSION.post(
+            GEN_ENDPOINT, json=payload, headers=headers, timeout=20, stream=True
+        ) as r:
+            r.raise_for_status()
+            for line in r.iter_lines(chunk_size=64 * 1024):
+                if not line.strip():
+                    continue
+                lines += 1
+                size += len(line)
+                timer.pause()
+                yield line
+                timer.resume()
+
+        PHASE_SECONDS.observe(timer.busy_s, phase="docs.fetch")
         log.info(
-            "action=docs.fetch component=loader outcome=success status=%s duration_ms=%.1f",
+            "action=docs.fetch component=loader outcome=success status=%s docs=%s bytes=%s duration_ms=%.1f",
             r.status_code,
-            time_diff,
+            lines,
+            size,
+            timer.busy_s * 1000,
         )
-        return r.text
     except Exception:
-        time_diff = (time.monotonic() - time_start) * 1000
+        ERRORS.inc(phase="docs.fetch")
         log.exception(
-            "action=docs.fetch component=loader outcome=error duration_ms=%.1f",
-            time_diff,
+            "action=docs.fetch component=loader outcome=error docs=%s duration_ms=%.1f",
+            lines,
+            timer.busy_s * 1000,
+        )
+        raise
+    finally:
+        DOCS.inc(lines, outcome="fetched")
+        BYTES.inc(size, phase="docs.fetch")
+
+
+def load_schema_fields():
+    """
+    Read the field map for SCHEMA_NAME from the schemas table (db) or from
+    SCHEMA_FILE (file), falling back to SCHEMA_FIELDS. SCHEMA_FILE fields
+    are normalised like a POST /schemas body; unknown types raise ValueError.
+    """
+    time_start = time.monotonic()
+    if SHIPPER_SOURCE == "db":
+        row = DB().query_one(
+            "SELECT `fields` FROM `schemas` WHERE `name`=%s", (SCHEMA_NAME,)
+        )
+        if row is None:
+            raise RuntimeError(f"Schema {SCHEMA_NAME!r} not found in the database")
+        fields = json.loads(row["fields"])
+    elif SCHEMA_FILE:
+        with open(SCHEMA_FILE) as f:
+            fields, bad_types = process_fields(json.load(f)["fields"])
+        if bad_types:
+            raise ValueError(f"unknown data types in {SCHEMA_FILE}: {bad_types}")
+    else:
+        fields = SCHEMA_FIELDS
+    log.info(
+        "action=schema.load component=loader outcome=success source=%s schema_name=%s fields=%s duration_ms=%.1f",
+        SHIPPER_SOURCE,
+        SCHEMA_NAME,
+        len(fields),
+        (time.monotonic() - time_start) * 1000,
+    )
+    return fields
+
+
+plan = None
+
+
+def generate_doc_lines():
+    """
+    Generate COUNT documents in-process (or in the genpool process pool for
+    large counts) and yield each as an NDJSON line in bytes, the same
+    shape fetch_doc_lines produces without the HTTP round trip.
+    """
+    global plan
+    timer = SourceTimer("docs.generate")
+    lines = 0
+    size = 0
+    try:
+        with timer:
+            if plan is None:
+                plan = compile_schema(load_schema_fields())
+            for batch in genpool.iter_encoded(
+                plan, COUNT, None, 0, plan.template(), GEN_BATCH_SIZE
+            ):
+                for line in batch:
+                    lines += 1
+                    size += len(line)
+                    timer.pause()
+                    yield line
+                    timer.resume()
+
+        PHASE_SECONDS.observe(timer.busy_s, phase="docs.generate")
+        log.info(
+            "action=docs.generate component=loader outcome=success docs=%s bytes=%s duration_ms=%.1f",
+            lines,
+            size,
+            timer.busy_s * 1000,
+        )
+    except Exception:
+        ERRORS.inc(phase="docs.generate")
+        log.exception(
+            "action=docs.generate component=loader outcome=error docs=%s duration_ms=%.1f",
+            lines,
+            timer.busy_s * 1000,
         )
         raise
+    finally:
+        DOCS.inc(lines, outcome="generated")
+        BYTES.inc(size, phase="docs.generate")
+
+
+def doc_lines():
+    if SHIPPER_SOURCE == "api":
+        return fetch_doc_lines()
+    return generate_doc_lines()
 
 
 def build_bulk_body(doc_ndjson):
@@ -112,50 +395,328 @@ def build_bulk_body(doc_ndjson):
         line = line.strip()
         if not line:
             continue
-        out.append(json.dumps({"index": {"_index": ES_INDEX}}))
+        out.append(ACTION_LINE)
         out.append(line)
     return "\n".join(out) + "\n"
 
 
-def bulk_upload():
+def bulk_body(lines):
+    ### ACTION doc \n ACTION doc \n ... in a single join
+    return ACTION_BYTES + (b"\n" + ACTION_BYTES).join(lines) + b"\n"
+
+
+def iter_bulk_chunks(lines, max_docs=None, max_bytes=None):
+    """
+    Group document lines (bytes) into bulk bodies of at most max_docs
+    documents and max_bytes bytes, yielding (body, docs) as each fills.
+    Without max_docs each body takes the sizer's current limit.
+    A single document larger than max_bytes is still sent on its own.
+    """
+    max_bytes = max_bytes or BULK_MAX_BYTES
+    limit = max_docs or SIZER.size
+    chunk = []
+    chunk_bytes = 0
+    for line in lines:
+        size = len(ACTION_BYTES) + len(line) + 1
+        if chunk and (len(chunk) >= limit or chunk_bytes + size > max_bytes):
+            yield build_chunk(chunk), len(chunk)
+            chunk = []
+            chunk_bytes = 0
+            limit = max_docs or SIZER.size
+        chunk.append(line)
+        chunk_bytes += size
+    if chunk:
+        yield build_chunk(chunk), len(chunk)
+
+
+def build_chunk(chunk):
+    time_start = time.perf_counter()
+    body = bulk_body(chunk)
+    PHASE_SECONDS.observe(time.perf_counter() - time_start, phase="bulk.build")
+    return body
+
+
+def item_results(res):
+    ### one (status, error) per document, in request order
+    return [
+        (result.get("status", 0), result.get("error"))
+        for result in (next(iter(item.values()), {}) for item in res.get("items", []))
+    ]
+
+
+def request_status(error):
+    ### the status every document of a failed bulk request is given
+    if isinstance(error, ApiError):
+        return error.status_code
+    if isinstance(error, ConnectionTimeout):
+        return TIMEOUT_STATUS
+    return 0
+
+
+def backoff(attempt):
+    ### full jitter: anywhere between 0 and the capped exponential delay
+    delay_ms = min(BULK_BACKOFF_MAX_MS, BULK_BACKOFF_MS * 2 ** (attempt - 1))
+    return random.uniform(0, delay_ms) / 1000
+
+
+def refresh_index():
+    global last_refresh
+    with refresh_lock:
+        if time.monotonic() - last_refresh < BULK_REFRESH_PERIOD:
+            return
+        last_refresh = time.monotonic()
     time_start = time.monotonic()
     try:
-        doc_ndjson = fetch_docs_raw()
-        body = build_bulk_body(doc_ndjson)
+        ES.indices.refresh(index=ES_INDEX)
+        log.info(
+            "action=index.refresh component=loader outcome=success index=%s duration_ms=%.1f",
+            ES_INDEX,
+            (time.monotonic() - time_start) * 1000,
+        )
+    except Exception:
+        ERRORS.inc(phase="index.refresh")
+        log.exception(
+            "action=index.refresh component=loader outcome=error index=%s duration_ms=%.1f",
+            ES_INDEX,
+            (time.monotonic() - time_start) * 1000,
+        )
+
 
+def bulk_refresh():
+    ### the refresh parameter for bulk requests
+    if BULK_REFRESH == "wait_for" and not BULK_DISABLE_REFRESH:
+        return "wait_for"
+    return None
+
+
+def post_bulk(body, docs, attempt):
+    """
+    Make one bulk request and feed its latency and rejections to the sizer.
+    Returns None if every document was indexed, otherwise a (status, error)
+    per document; a failed request gives every document the request's
+    status (see request_status).
+    """
+    refresh = bulk_refresh()
+    time_start = time.monotonic()
+    IN_FLIGHT.inc(phase="bulk.upload")
+    try:
         res = ES.options(
             headers={"Content-Type": "application/x-ndjson"},
             request_timeout=30,
-        ).bulk(operations=body, refresh="wait_for")
-
+        ).bulk(operations=body, refresh=refresh)
+    except Exception as e:
         time_diff = (time.monotonic() - time_start) * 1000
-        has_errors = bool(res.get("errors"))
+        ERRORS.inc(phase="bulk.upload")
+        status = request_status(e)
+        ### a whole-request 429 means the cluster is saturated: back off hard
+        bulk_size = SIZER.record(time_diff, docs if status == 429 else 0)
+        log.exception(
+            "action=bulk.upload component=loader outcome=error index=%s attempt=%s status=%s docs=%s bytes=%s bulk_size=%s duration_ms=%.1f",
+            ES_INDEX,
+            attempt,
+            status,
+            docs,
+            len(body),
+            bulk_size,
+            time_diff,
+        )
+        error = {"type": type(e).__name__, "reason": str(e)[:300]}
+        return [(status, error)] * docs
+    finally:
+        IN_FLIGHT.dec(phase="bulk.upload")
 
-        if has_errors:
-            log.warning(
-                "action=bulk.upload component=loader outcome=partial_success index=%s errors=%s duration_ms=%.1f",
-                ES_INDEX,
-                True,
-                time_diff,
-            )
-            log.error(
-                "action=bulk.upload component=loader error_sample=%s",
-                json.dumps(res.get("items", [])[:2])[:300],
-            )
-        else:
-            log.info(
-                "action=bulk.upload component=loader outcome=success index=%s errors=%s duration_ms=%.1f",
-                ES_INDEX,
-                False,
-                time_diff,
-            )
+    time_diff = (time.monotonic() - time_start) * 1000
+    PHASE_SECONDS.observe(time_diff / 1000, phase="bulk.upload")
+    BYTES.inc(len(body), phase="bulk.upload")
+    results = item_results(res) if res.get("errors") else None
+    ### es_rejected_execution_exception comes back as a 429 item
+    rejected = sum(status == 429 for status, _ in results) if results else 0
+    bulk_size = SIZER.record(time_diff, rejected)
+    if results:
+        log.warning(
+            "action=bulk.upload component=loader outcome=partial_success index=%s attempt=%s errors=%s docs=%s rejected=%s bytes=%s bulk_size=%s docs_per_s=%.1f duration_ms=%.1f",
+            ES_INDEX,
+            attempt,
+            True,
+            docs,
+            rejected,
+            len(body),
+            bulk_size,
+            docs / time_diff * 1000,
+            time_diff,
+        )
+    else:
+        log.info(
+            "action=bulk.upload component=loader outcome=success index=%s attempt=%s errors=%s docs=%s bytes=%s bulk_size=%s docs_per_s=%.1f duration_ms=%.1f",
+            ES_INDEX,
+            attempt,
+            False,
+            docs,
+            len(body),
+            bulk_size,
+            docs / time_diff * 1000,
+            time_diff,
+        )
+    return results
+
+
+def write_dead_letters(dead):
+    records = [
+        {
+            "index": ES_INDEX,
+            "status": status,
+            "error": error,
+            "attempts": attempts,
+            "source": line.decode("utf-8", "replace"),
+        }
+        for line, status, error, attempts in dead
+    ]
+    with dead_letter_lock, open(DEAD_LETTER_FILE, "ab") as f:
+        f.write(serializer.dumps_lines(records))
+
+
+class BulkDeferred(Exception):
+    """Raised by send_bulk(hold=True) with the documents still to send."""
+
+    def __init__(self, body, docs, indexed):
+        super().__init__(f"{docs} documents deferred")
+        self.body = body
+        self.docs = docs
+        self.indexed = indexed
+
+
+def send_bulk(body, docs, hold=False):
+    """
+    Send one bulk body. Documents rejected with a retryable status are
+    re-sent with jittered exponential backoff, up to BULK_RETRIES times;
+    the rest of the failures, and retries that run out, are appended to
+    DEAD_LETTER_FILE. With hold, retries that run out are raised back as
+    BulkDeferred instead. Returns the number of documents indexed.
+    """
+    indexed = 0
+    retried = 0
+    dead = []
+    held = []
+    attempt = 0
+    while True:
+        results = post_bulk(body, docs, attempt)
+        if results is None:
+            indexed += docs
+            break
+
+        retry = []
+        for line, (status, error) in zip(body.split(b"\n")[1::2], results):
+            if 0 < status < 300:
+                indexed += 1
+            elif status in RETRY_STATUSES and attempt < BULK_RETRIES:
+                retry.append(line)
+            elif status in RETRY_STATUSES and hold:
+                held.append(line)
+            else:
+                dead.append((line, status, error, attempt + 1))
+        if not retry:
+            break
+
+        attempt += 1
+        retried += len(retry)
+        time.sleep(backoff(attempt))
+        body = bulk_body(retry)
+        docs = len(retry)
+
+    if dead:
+        write_dead_letters(dead)
+        log.error(
+            "action=bulk.dead_letter component=loader index=%s docs=%s file=%s error_sample=%s",
+            ES_INDEX,
+            len(dead),
+            DEAD_LETTER_FILE,
+            json.dumps([error for _, _, error, _ in dead[:2]])[:300],
+        )
+    DOCS.inc(indexed, outcome="indexed")
+    DOCS.inc(retried, outcome="retried")
+    DOCS.inc(len(dead), outcome="failed")
+    DOCS.inc(len(held), outcome="deferred")
+    log.info(
+        "action=bulk.batch component=loader outcome=%s index=%s indexed=%s retried=%s failed=%s deferred=%s attempts=%s",
+        "failed" if dead else "deferred" if held else "success",
+        ES_INDEX,
+        indexed,
+        retried,
+        len(dead),
+        len(held),
+        attempt + 1,
+    )
+    if BULK_REFRESH == "interval":
+        refresh_index()
+    if held:
+        raise BulkDeferred(bulk_body(held), len(held), indexed)
+    return indexed
+
+
+def send_spooled(body, docs):
+    """
+    Send a spooled chunk, holding on to whatever ES will not take yet and
+    trying again every SPOOL_RETRY_INTERVAL seconds, so the chunk is only
+    acked once each document is indexed or dead-lettered.
+    """
+    indexed = 0
+    while True:
+        try:
+            return indexed + send_bulk(body, docs, hold=True)
+        except BulkDeferred as e:
+            indexed += e.indexed
+            body, docs = e.body, e.docs
+            time.sleep(SPOOL_RETRY_INTERVAL)
+
+
+def ship_spooled(record):
+    """
+    Send and ack one spool record. Returns the number of documents indexed,
+    or None after logging a failure; the record is then left unacked for
+    the caller to send again.
+    """
+    token, body, docs = record
+    try:
+        sent = send_spooled(body, docs)
+        spool.ack(token)
+        return sent
+    except Exception:
+        ERRORS.inc(phase="spool.drain")
+        log.exception(
+            "action=spool.drain component=loader outcome=error docs=%s retry_s=%s",
+            docs,
+            SPOOL_RETRY_INTERVAL,
+        )
+        return None
+
+
+def drain_spool():
+    while True:
+        record = spool.get(timeout=1)
+        if record is None:
+            continue
+        while ship_spooled(record) is None:
+            time.sleep(SPOOL_RETRY_INTERVAL)
+
+
+def bulk_upload():
+    time_start = time.monotonic()
+    sent = 0
+    try:
+        for body, docs in iter_bulk_chunks(doc_lines()):
+            if spool is not None:
+                spool.put(body, docs)
+                sent += docs
+            else:
+                sent += send_bulk(body, docs)
     except Exception:
-        time_diff = (time.monotonic() - time_start) * 1000
         log.exception(
-            "action=bulk.upload component=loader outcome=error index=%s duration_ms=%.1f",
+            "action=bulk.upload component=loader outcome=error index=%s docs=%s duration_ms=%.1f",
             ES_INDEX,
-            time_diff,
+            sent,
+            (time.monotonic() - time_start) * 1000,
         )
+    return sent
 
 
 def mapping_index():
@@ -207,18 +768,215 @@ def mapping_index():
         )
 
 
+@contextmanager
+def refresh_disabled():
+    """
+    With BULK_DISABLE_REFRESH set, turn off periodic refreshes of the index
+    for the duration of the block, then restore the previous
+    refresh_interval (unset restores the default) and refresh once.
+    """
+    if not BULK_DISABLE_REFRESH:
+        yield
+        return
+
+    res = ES.indices.get_settings(index=ES_INDEX, name="index.refresh_interval")
+    previous = (
+        res.get(ES_INDEX, {})
+        .get("settings", {})
+        .get("index", {})
+        .get("refresh_interval")
+    )
+    ES.indices.put_settings(
+        index=ES_INDEX, settings={"index": {"refresh_interval": "-1"}}
+    )
+    log.info(
+        "action=index.refresh_interval component=loader outcome=disabled index=%s previous=%s",
+        ES_INDEX,
+        previous,
+    )
+    try:
+        yield
+    finally:
+        ES.indices.put_settings(
+            index=ES_INDEX, settings={"index": {"refresh_interval": previous}}
+        )
+        ES.indices.refresh(index=ES_INDEX)
+        log.info(
+            "action=index.refresh_interval component=loader outcome=restored index=%s refresh_interval=%s",
+            ES_INDEX,
+            previous,
+        )
+
+
+def summary_logger():
+    """
+    Return a function that logs one metrics.summary line, with rates
+    measured since its previous call.
+    """
+    last = {"time": time.monotonic(), "indexed": 0, "bytes": 0}
+
+    def quantile_ms(q, phase):
+        value = PHASE_SECONDS.quantile(q, phase=phase)
+        return 0.0 if value is None else value * 1000
+
+    def log_summary():
+        now = time.monotonic()
+        docs = DOCS.collect()
+        sent = BYTES.collect().get(("bulk.upload",), 0)
+        indexed = docs.get(("indexed",), 0)
+        elapsed = now - last["time"]
+        in_flight = IN_FLIGHT.collect()
+        log.info(
+            "action=metrics.summary component=loader docs_indexed=%s docs_failed=%s docs_per_s=%.1f bytes_per_s=%.1f error_count=%s fetch_p50_ms=%.1f build_p95_ms=%.1f bulk_p50_ms=%.1f bulk_p95_ms=%.1f in_flight_fetch=%s in_flight_bulk=%s queue=%s bulk_size=%s",
+            indexed,
+            docs.get(("failed",), 0),
+            (indexed - last["indexed"]) / elapsed,
+            (sent - last["bytes"]) / elapsed,
+            sum(ERRORS.collect().values()),
+            quantile_ms(
+                0.5, "docs.generate" if SHIPPER_SOURCE != "api" else "docs.fetch"
+            ),
+            quantile_ms(0.95, "bulk.build"),
+            quantile_ms(0.5, "bulk.upload"),
+            quantile_ms(0.95, "bulk.upload"),
+            in_flight.get(("docs.fetch",), 0) + in_flight.get(("docs.generate",), 0),
+            in_flight.get(("bulk.upload",), 0),
+            QUEUE_DEPTH.collect().get((), 0),
+            SIZER.size,
+        )
+        last.update(time=now, indexed=indexed, bytes=sent)
+
+    return log_summary
+
+
 def run_intervals():
     log.info(
-        "action=runner.start component=loader outcome=started index=%s interval_s=%s",
+        "action=runner.start component=loader outcome=started index=%s source=%s interval_s=%s",
         ES_INDEX,
+        SHIPPER_SOURCE,
         INTERVAL,
     )
+    if spool is not None:
+        QUEUE_DEPTH.set_function(lambda: spool.records)
+        for _ in range(BULK_CONCURRENCY):
+            threading.Thread(target=drain_spool, daemon=True).start()
     while True:
         bulk_upload()
         time.sleep(INTERVAL)
 
 
+async def fetch_worker(queue, stats):
+    loop = asyncio.get_running_loop()
+
+    def produce():
+        ### runs in a worker thread; each chunk is queued as soon as it fills, and
+        ### waiting on a full queue keeps the HTTP stream from racing ahead of ES
+        for chunk in iter_bulk_chunks(doc_lines()):
+            if spool is not None:
+                spool.put(*chunk)
+            else:
+                asyncio.run_coroutine_threadsafe(queue.put(chunk), loop).result()
+
+    while True:
+        try:
+            await asyncio.to_thread(produce)
+        except Exception:
+            ### already logged; back off so a down API is not hammered
+            await asyncio.sleep(1)
+            continue
+        stats["fetched"] += 1
+
+
+async def index_worker(queue, stats):
+    while True:
+        if spool is not None:
+            record = await asyncio.to_thread(spool.get, 1)
+            if record is None:
+                continue
+            while (sent := await asyncio.to_thread(ship_spooled, record)) is None:
+                await asyncio.sleep(SPOOL_RETRY_INTERVAL)
+        else:
+            body, docs = await queue.get()
+            try:
+                sent = await asyncio.to_thread(send_bulk, body, docs)
+            finally:
+                queue.task_done()
+        stats["docs"] += sent
+        stats["indexed"] += 1
+
+
+async def report_stats(queue, stats):
+    last_docs = 0
+    last_time = time.monotonic()
+    while True:
+        await asyncio.sleep(STATS_INTERVAL)
+        now = time.monotonic()
+        log.info(
+            "action=pipeline.stats component=loader fetched=%s indexed=%s docs=%s docs_per_s=%.1f queue=%s bulk_size=%s",
+            stats["fetched"],
+            stats["indexed"],
+            stats["docs"],
+            (stats["docs"] - last_docs) / (now - last_time),
+            queue.qsize() if spool is None else spool.records,
+            SIZER.size,
+        )
+        last_docs = stats["docs"]
+        last_time = now
+
+
+async def run_pipeline():
+    """
+    Fetch batch N+1 while batch N is being indexed. FETCH_CONCURRENCY
+    fetchers feed a queue of at most QUEUE_SIZE bulk chunks that
+    BULK_CONCURRENCY indexers drain, so fetching blocks when ES falls
+    behind. The blocking clients run in a thread pool sized to match.
+    """
+    log.info(
+        "action=runner.start component=loader outcome=started mode=pipeline index=%s source=%s fetch_concurrency=%s bulk_concurrency=%s queue_size=%s",
+        ES_INDEX,
+        SHIPPER_SOURCE,
+        FETCH_CONCURRENCY,
+        BULK_CONCURRENCY,
+        QUEUE_SIZE,
+    )
+    asyncio.get_running_loop().set_default_executor(
+        ThreadPoolExecutor(max_workers=FETCH_CONCURRENCY + BULK_CONCURRENCY)
+    )
+    queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+    QUEUE_DEPTH.set_function(queue.qsize if spool is None else lambda: spool.records)
+    stats = {"fetched": 0, "indexed": 0, "docs": 0}
+    workers = [fetch_worker(queue, stats) for _ in range(FETCH_CONCURRENCY)]
+    workers += [index_worker(queue, stats) for _ in range(BULK_CONCURRENCY)]
+    await asyncio.gather(report_stats(queue, stats), *workers)
+
+
 if __name__ == "__main__":
-    create_schema()
+    ### docker stop sends SIGTERM; exit through the finally blocks so a disabled
+    ### refresh_interval is restored
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    if SHIPPER_SOURCE == "api":
+        create_schema()
     mapping_index()
-    run_intervals()
+    if SHIPPER_SOURCE == "file":
+        ### a bad SCHEMA_FILE will not fix itself: stop before the loop starts
+        plan = compile_schema(load_schema_fields())
+    if METRICS_PORT:
+        metrics.serve(METRICS_PORT, METRICS_HOST)
+    metrics.every(METRICS_LOG_INTERVAL, summary_logger())
+    if SPOOL_DIR:
+        spool = Spool(
+            SPOOL_DIR,
+            SPOOL_MAX_BYTES,
+            SPOOL_SEGMENT_BYTES,
+            SPOOL_FSYNC,
+            SPOOL_FSYNC_INTERVAL,
+        )
+    try:
+        with refresh_disabled():
+            if SHIPPER_MODE == "pipeline":
+                asyncio.run(run_pipeline())
+            else:
+                run_intervals()
+    finally:
+        if spool is not None:
+            spool.close()
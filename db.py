@@ -1,11 +1,153 @@
 import os
 import pymysql
+import threading
 import time
+from collections import deque
+from contextlib import contextmanager
 from logsetup import setup_logging, get_logger
 
 setup_logging()
 log = get_logger(__name__)
 
+ER_DUP_FIELDNAME = 1060
+
+
+class ConnectionPool:
+    """
+    Bounded pool of connections made by `connect`. Idle connections are
+    handed out most-recently-used first, pinged if they sat idle longer
+    than ping_interval, and replaced once older than max_lifetime.
+    Checkout blocks for up to `timeout` seconds when all max_size are in use.
+    """
+
+    def __init__(
+        self,
+        connect,
+        min_size,
+        max_size,
+        timeout,
+        max_lifetime,
+        ping_interval,
+        initial=(),
+    ):
+        self.connect = connect
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self.ping_interval = ping_interval
+
+        self.cond = threading.Condition()
+        self.idle = deque()  # (connection, created_at, last_used)
+        self.size = 0
+        self.in_use = 0
+        self.closed = False
+
+        now = time.monotonic()
+        for conn in initial:
+            self.idle.append((conn, now, now))
+            self.size += 1
+        while self.size < min_size:
+            self.idle.append((connect(), now, now))
+            self.size += 1
+
+    def acquire(self):
+        time_start = time.monotonic()
+        deadline = time_start + self.timeout
+        with self.cond:
+            while True:
+                if self.closed:
+                    raise RuntimeError("connection pool is closed")
+                if self.idle:
+                    item = self.idle.pop()
+                    break
+                if self.size < self.max_size:
+                    self.size += 1
+                    item = None
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise RuntimeError(
+                        f"Timed out after {self.timeout}s waiting for a MySQL connection "
+                        f"(pool size={self.size}, in use={self.in_use})"
+                    )
+                self.cond.wait(remaining)
+            self.in_use += 1
+
+        try:
+            item = self._checkout(item)
+        except Exception:
+            with self.cond:
+                self.size -= 1
+                self.in_use -= 1
+                self.cond.notify()
+            raise
+
+        wait_ms = (time.monotonic() - time_start) * 1000
+        return item, wait_ms
+
+    def _checkout(self, item):
+        now = time.monotonic()
+        if item is None:
+            return self.connect(), now
+
+        conn, created_at, last_used = item
+        if now - created_at >= self.max_lifetime:
+            self._close(conn)
+            log.info(
+                "action=db.pool.recycle component=db outcome=success age_s=%.1f",
+                now - created_at,
+            )
+            return self.connect(), now
+        if now - last_used >= self.ping_interval:
+            try:
+                conn.ping(reconnect=True)
+            except Exception:
+                self._close(conn)
+                raise
+        return conn, created_at
+
+    def release(self, item):
+        conn, created_at = item
+        with self.cond:
+            self.in_use -= 1
+            if self.closed or not conn.open:
+                self.size -= 1
+                discard = True
+            else:
+                self.idle.append((conn, created_at, time.monotonic()))
+                discard = False
+            self.cond.notify()
+
+        if discard:
+            self._close(conn)
+
+    @contextmanager
+    def connection(self):
+        item, wait_ms = self.acquire()
+        try:
+            yield item[0], wait_ms
+        finally:
+            self.release(item)
+
+    def close(self):
+        with self.cond:
+            self.closed = True
+            idle = list(self.idle)
+            self.idle.clear()
+            self.size -= len(idle)
+            self.cond.notify_all()
+
+        for conn, _, _ in idle:
+            self._close(conn)
+
+    @staticmethod
+    def _close(conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
 
 class DB:
     def __init__(self):
@@ -15,27 +157,27 @@ class DB:
         self.user = os.environ.get("DB_USER")
         self.password = os.environ.get("DB_PASSWORD")
 
+        ### size the pool against waitress's worker threads (4 by default)
+        self.pool_min = int(os.environ.get("DB_POOL_MIN", "1"))
+        self.pool_max = int(os.environ.get("DB_POOL_MAX", "4"))
+        self.pool_timeout = float(os.environ.get("DB_POOL_TIMEOUT", "10"))
+        self.pool_max_lifetime = float(os.environ.get("DB_POOL_MAX_LIFETIME", "1800"))
+        self.pool_ping_interval = float(os.environ.get("DB_POOL_PING_INTERVAL", "30"))
+        ### called as hook(action, outcome, duration_ms) after every query
+        self.hooks = []
+
         time_start = time.monotonic()
-        self.connection = None  # ensure defined even if all retries fail
+        connection = None  # ensure defined even if all retries fail
         last = None
         for _ in range(20):
             try:
-                self.connection = pymysql.connect(
-                    host=self.host,
-                    port=self.port,
-                    user=self.user,
-                    password=self.password,
-                    database=self.name,
-                    autocommit=True,
-                    charset="utf8mb4",
-                    cursorclass=pymysql.cursors.DictCursor,
-                )
+                connection = self.connect()
                 break
             except Exception as e:
                 last = e
                 time.sleep(0.5)
 
-        if self.connection is None:
+        if connection is None:
             time_diff = (time.monotonic() - time_start) * 1000
             log.error(
                 "action=db.connect component=db outcome=error host=%s port=%s last_error=%s duration_ms=%.1f",
@@ -47,14 +189,37 @@ class DB:
             raise RuntimeError(
                 f"Could not connect to MySQL at {self.host}:{self.port}: {last}"
             )
-        else:
-            time_diff = (time.monotonic() - time_start) * 1000
-            log.info(
-                "action=db.connect component=db outcome=success host=%s port=%s duration_ms=%.1f",
-                self.host,
-                self.port,
-                time_diff,
-            )
+
+        self.pool = ConnectionPool(
+            self.connect,
+            self.pool_min,
+            self.pool_max,
+            self.pool_timeout,
+            self.pool_max_lifetime,
+            self.pool_ping_interval,
+            initial=[connection],
+        )
+        time_diff = (time.monotonic() - time_start) * 1000
+        log.info(
+            "action=db.connect component=db outcome=success host=%s port=%s pool_min=%s pool_max=%s duration_ms=%.1f",
+            self.host,
+            self.port,
+            self.pool_min,
+            self.pool_max,
+            time_diff,
+        )
+
+    def connect(self):
+        return pymysql.connect(
+            host=self.host,
+            port=self.port,
+            user=self.user,
+            password=self.password,
+            database=self.name,
+            autocommit=True,
+            charset="utf8mb4",
+            cursorclass=pymysql.cursors.DictCursor,
+        )
 
     def init_schema(self):
         time_start = time.monotonic()
@@ -62,9 +227,26 @@ class DB:
             CREATE TABLE IF NOT EXISTS `schemas` (
             `id` INT AUTO_INCREMENT PRIMARY KEY,
             `name` VARCHAR(255) NOT NULL UNIQUE,
-            `fields` JSON NOT NULL
+            `fields` JSON NOT NULL,
+            `updated_at` TIMESTAMP(6) NOT NULL
+                DEFAULT CURRENT_TIMESTAMP(6) ON UPDATE CURRENT_TIMESTAMP(6)
             );
         """)
+        ### tables created before `updated_at` existed need it for cache invalidation
+        column = self.query_one(
+            "SELECT 1 FROM information_schema.COLUMNS "
+            "WHERE TABLE_SCHEMA=DATABASE() AND TABLE_NAME='schemas' AND COLUMN_NAME='updated_at'"
+        )
+        if not column:
+            try:
+                self.execute("""
+                    ALTER TABLE `schemas` ADD COLUMN `updated_at` TIMESTAMP(6) NOT NULL
+                    DEFAULT CURRENT_TIMESTAMP(6) ON UPDATE CURRENT_TIMESTAMP(6);
+                """)
+            except pymysql.err.OperationalError as e:
+                ### another replica added it first
+                if e.args[0] != ER_DUP_FIELDNAME:
+                    raise
         time_diff = (time.monotonic() - time_start) * 1000
         log.info(
             "action=db.init_schema component=db outcome=success duration_ms=%.1f",
@@ -73,26 +255,37 @@ class DB:
 
     def close(self):
         try:
-            self.connection.close()
+            self.pool.close()
             log.info("action=db.close component=db outcome=success")
         except Exception:
             log.exception("action=db.close component=db outcome=error")
 
+    def observe(self, action, outcome, time_diff):
+        for hook in self.hooks:
+            hook(action, outcome, time_diff)
+
     def execute(self, sql, params=None):
         time_start = time.monotonic()
         try:
-            with self.connection.cursor() as cur:
-                cur.execute(sql, params) if params is not None else cur.execute(sql)
-                rows = cur.rowcount
+            with self.pool.connection() as (conn, wait_ms):
+                with conn.cursor() as cur:
+                    cur.execute(sql, params) if params is not None else cur.execute(sql)
+                    rows = cur.rowcount
+                in_use = self.pool.in_use
             time_diff = (time.monotonic() - time_start) * 1000
+            self.observe("db.execute", "success", time_diff)
             log.info(
-                "action=db.execute component=db outcome=success rows=%s duration_ms=%.1f",
+                "action=db.execute component=db outcome=success rows=%s pool_wait_ms=%.1f pool_in_use=%s pool_size=%s duration_ms=%.1f",
                 rows,
+                wait_ms,
+                in_use,
+                self.pool.size,
                 time_diff,
             )
             return rows
         except Exception:
             time_diff = (time.monotonic() - time_start) * 1000
+            self.observe("db.execute", "error", time_diff)
             log.exception(
                 "action=db.execute component=db outcome=error duration_ms=%.1f",
                 time_diff,
@@ -102,18 +295,25 @@ class DB:
     def query_one(self, sql, params=None):
         time_start = time.monotonic()
         try:
-            with self.connection.cursor() as cur:
-                cur.execute(sql, params) if params is not None else cur.execute(sql)
-                row = cur.fetchone()
+            with self.pool.connection() as (conn, wait_ms):
+                with conn.cursor() as cur:
+                    cur.execute(sql, params) if params is not None else cur.execute(sql)
+                    row = cur.fetchone()
+                in_use = self.pool.in_use
             time_diff = (time.monotonic() - time_start) * 1000
+            self.observe("db.query_one", "success", time_diff)
             log.info(
-                "action=db.query_one component=db outcome=success found=%s duration_ms=%.1f",
+                "action=db.query_one component=db outcome=success found=%s pool_wait_ms=%.1f pool_in_use=%s pool_size=%s duration_ms=%.1f",
                 bool(row),
+                wait_ms,
+                in_use,
+                self.pool.size,
                 time_diff,
             )
             return row
         except Exception:
             time_diff = (time.monotonic() - time_start) * 1000
+            self.observe("db.query_one", "error", time_diff)
             log.exception(
                 "action=db.query_one component=db outcome=error duration_ms=%.1f",
                 time_diff,
@@ -123,18 +323,25 @@ class DB:
     def query_all(self, sql, params=None):
         time_start = time.monotonic()
         try:
-            with self.connection.cursor() as cur:
-                cur.execute(sql, params) if params is not None else cur.execute(sql)
-                rows = cur.fetchall()
+            with self.pool.connection() as (conn, wait_ms):
+                with conn.cursor() as cur:
+                    cur.execute(sql, params) if params is not None else cur.execute(sql)
+                    rows = cur.fetchall()
+                in_use = self.pool.in_use
             time_diff = (time.monotonic() - time_start) * 1000
+            self.observe("db.query_all", "success", time_diff)
             log.info(
-                "action=db.query_all component=db outcome=success rows=%s duration_ms=%.1f",
+                "action=db.query_all component=db outcome=success rows=%s pool_wait_ms=%.1f pool_in_use=%s pool_size=%s duration_ms=%.1f",
                 len(rows),
+                wait_ms,
+                in_use,
+                self.pool.size,
                 time_diff,
             )
             return rows
         except Exception:
             time_diff = (time.monotonic() - time_start) * 1000
+            self.observe("db.query_all", "error", time_diff)
             log.exception(
                 "action=db.query_all component=db outcome=error duration_ms=%.1f",
                 time_diff,
@@ -1,10 +1,18 @@
+import ipaddress
 import random
+import threading
 import iso3166
+from collections import Counter
 from datetime import date
+from functools import lru_cache
+from itertools import accumulate
 import coolname
 from faker import Faker
+from faker.providers.person import Provider as PersonProvider
+from serializer import RowTemplate
 
-faker = Faker("en_GB")
+LOCALE = "en_GB"
+faker = Faker(LOCALE)
 ALLOWED_TYPES = {
     "integer",
     "name",
@@ -18,6 +26,22 @@ ALLOWED_TYPES = {
     "gamertag",
 }
 
+### value type each field type's column holds, for RowTemplate; others are encoded generically
+VALUE_TYPES = {
+    "integer": int,
+    "name": str,
+    "dob": str,
+    "country": str,
+    "ip": str,
+    "game": str,
+    "role": str,
+    "org": str,
+    "gamertag": str,
+}
+
+### documents per seeded chunk; changing it changes every seeded dataset
+SEED_CHUNK_SIZE = 1000
+
 PLACEMENTS = ["Winner", "Runner-up", "3rd-4th", "Top 8", "Top 16"]
 
 GAMES = {
@@ -101,156 +125,755 @@ GAMES = {
 }
 
 
-def generate_game(value):
+### Faker keeps its rng on the instance, so each thread gets its own copy that is
+### pointed at the caller's rng before use; the module-level `random` keeps using
+### the shared instance as before
+local = threading.local()
+
+
+def faker_for(rng):
+    if rng is random:
+        return faker
+
+    fake = getattr(local, "faker", None)
+    if fake is None:
+        fake = local.faker = Faker(LOCALE)
+    fake.random = rng
+    return fake
+
+
+### every compile_* returns column(count, columns, rng): `count` values for one field
+### drawn from `rng`, where `columns` holds the fields drawn so far (role/org/trophies
+### read the game column)
+
+
+def compile_game(value):
     option = value.get("option")
     if option is not None:
         opt = option.strip().lower()
         if opt == "lol":
-            return "league_of_legends"
-        if opt == "cs2":
-            return "cs2"
-        raise ValueError("option must be 'lol' or 'cs2'")
+            game = "league_of_legends"
+        elif opt == "cs2":
+            game = "cs2"
+        else:
+            raise ValueError("option must be 'lol' or 'cs2'")
+        return lambda count, columns, rng: [game] * count
 
-    return random.choice(list(GAMES.keys()))
+    games = list(GAMES.keys())
+    return lambda count, columns, rng: rng.choices(games, k=count)
 
 
-def generate_role(value, document, name):
-    game = document.get(name)
-    if not game:
-        raise ValueError("role requires 'game' to be generated first")
+def compile_game_choice(key, value, name, label):
+    ### shared by role/org: a fixed custom value, or a per-row pick from the row's game
+    if name is None:
+        raise ValueError(f"{label} requires 'game' to be generated first")
 
-    role = value.get("custom")
-    if role is not None:
-        return role
+    custom = value.get("custom")
+    if custom is not None:
+        return lambda count, columns, rng: [custom] * count
 
-    roles = GAMES[game].get("roles")
-    return random.choice(roles)
+    options = {game: (data[key], len(data[key])) for game, data in GAMES.items()}
 
+    def column(count, columns, rng):
+        rand = rng.random
+        return [
+            choices[int(rand() * size)]
+            for choices, size in map(options.__getitem__, columns[name])
+        ]
 
-def generate_org(value, document, name):
-    game = document.get(name)
-    if not game:
-        raise ValueError("role requires 'game' to be generated first")
+    return column
 
-    org = value.get("custom")
-    if org is not None:
-        return org
 
-    orgs = GAMES[game].get("orgs")
-    return random.choice(orgs)
+def compile_role(value, name):
+    return compile_game_choice("roles", value, name, "role")
 
 
-def generate_trophies(value, document, name):
-    game = document.get(name)
-    if not game:
-        raise ValueError("role requires 'game' to be generated first")
+def compile_org(value, name):
+    return compile_game_choice("orgs", value, name, "org")
 
-    amount = value.get("amount")
 
+### wider day ranges draw ordinals instead of building a table (about 2.7 MB per 40k days)
+ISO_DAYS_MAX = 40000
+
+
+@lru_cache(maxsize=16)
+def iso_days(first, last):
+    ### ISO string for every day in an ordinal range, shared by plans with the same years
+    return tuple(date.fromordinal(day).isoformat() for day in range(first, last + 1))
+
+
+def draw_days(first, last):
+    """
+    Return a function drawing k ISO dates uniformly from the ordinal range
+    first..last: from the cached iso_days table when the range is at most
+    ISO_DAYS_MAX days, otherwise by formatting each drawn ordinal.
+    """
+    if last - first < ISO_DAYS_MAX:
+        days = iso_days(first, last)
+        return lambda rng, k: rng.choices(days, k=k)
+
+    fromordinal = date.fromordinal
+
+    def draw(rng, k):
+        randint = rng.randint
+        return [fromordinal(randint(first, last)).isoformat() for _ in range(k)]
+
+    return draw
+
+
+def compile_trophies(value, name):
+    if name is None:
+        raise ValueError("trophies requires 'game' to be generated first")
+
+    amount = value.get("amount")
     if amount is not None:
         amount = int(amount)
-    else:
-        low = int(value.get("min", 1))
-        high = int(value.get("max", 10))
-        amount = random.randint(low, high)
-
-    trophies = []
-    tournaments = GAMES[game].get("tournaments")
+    low = int(value.get("min", 1))
+    high = int(value.get("max", 10))
+    if amount is None and low > high:
+        raise ValueError("trophies min must not be greater than max")
 
     start_year = int(value.get("start_year", 2012))
     end_year = int(value.get("end_year", date.today().year))
+    if start_year > end_year:
+        raise ValueError("trophies start_year must not be after end_year")
+    days = draw_days(
+        date(start_year, 1, 1).toordinal(), date(end_year, 12, 31).toordinal()
+    )
+
+    tournaments = {
+        game: (data["tournaments"], len(data["tournaments"]))
+        for game, data in GAMES.items()
+    }
 
-    for _ in range(amount):
-        d = faker.date_between_dates(
-            date_start=date(start_year, 1, 1), date_end=date(end_year, 12, 31)
-        )
-        d = d.isoformat()
-        tournament = random.choice(tournaments)
-        trophies.append(
-            {"tournament": f"{tournament} {d}", "placement": random.choice(PLACEMENTS)}
+    def column(count, columns, rng):
+        if amount is not None:
+            amounts = [amount] * count
+        else:
+            amounts = rng.choices(range(low, high + 1), k=count)
+
+        ### draw every trophy's day, tournament and placement at once, then split per row
+        total = sum(amounts)
+        rand = rng.random
+        picked_days = iter(days(rng, total))
+        picked_placements = iter(rng.choices(PLACEMENTS, k=total))
+        picked_tournaments = iter([rand() for _ in range(total)])
+
+        trophies = []
+        for game, size in zip(columns[name], amounts):
+            options, n = tournaments[game]
+            row = []
+            for _ in range(size):
+                tournament = options[int(next(picked_tournaments) * n)]
+                row.append(
+                    {
+                        "tournament": f"{tournament} {next(picked_days)}",
+                        "placement": next(picked_placements),
+                    }
+                )
+            trophies.append(row)
+        return trophies
+
+    return column
+
+
+### coolname 2.x keeps its internals in coolname.impl, 3.0 onwards in coolname._impl
+COOLNAME_IMPL = getattr(coolname, "impl", None) or getattr(coolname, "_impl", None)
+### single-value lists: Scalar before 3.0, Constant after
+COOLNAME_CONSTANTS = tuple(
+    getattr(COOLNAME_IMPL, name)
+    for name in ("Scalar", "Constant")
+    if hasattr(COOLNAME_IMPL, name)
+)
+
+
+def coolname_first_words(node):
+    ### {first word: number of coolname combinations starting with it}
+    impl = COOLNAME_IMPL
+    if isinstance(node, impl.CartesianList):
+        head = node._lists[0]
+        rest = node.length // head.length
+        return Counter(
+            {word: n * rest for word, n in coolname_first_words(head).items()}
         )
+    if isinstance(node, impl.NestedList):
+        counts = Counter()
+        for child in node._lists:
+            counts.update(coolname_first_words(child))
+        return counts
+    if isinstance(node, impl.WordAsPhraseWrapper):
+        return coolname_first_words(node._list)
+    if isinstance(node, impl.PhraseList):
+        return Counter(phrase[0] for phrase in node)
+    if isinstance(node, impl.WordList):
+        return Counter(node)
+    if COOLNAME_CONSTANTS and isinstance(node, COOLNAME_CONSTANTS):
+        return Counter([node.value])
+    raise TypeError(f"unexpected coolname list: {type(node).__name__}")
+
+
+def build_gamertag_words():
+    """
+    The words coolname.generate()[0] can return, capitalized, with cumulative
+    weights equal to how many coolname combinations start with each word.
+    The tables are read from coolname's word lists, so every process builds
+    the same ones; seeded output depends on it, hence no sampled fallback.
+    """
+    try:
+        default = getattr(COOLNAME_IMPL, "_default", None) or coolname._default
+        counts = coolname_first_words(default._lists[None])
+    except (AttributeError, KeyError, TypeError) as e:
+        raise RuntimeError(
+            f"cannot read the word lists of coolname {getattr(coolname, '__version__', '?')}: {e}"
+        ) from e
+    words = tuple(word.capitalize() for word in counts)
+    return words, tuple(accumulate(counts.values()))
 
-    return trophies
 
+### immutable, so every thread samples from the same tables without locking
+GAMERTAG_WORDS, GAMERTAG_WEIGHTS = build_gamertag_words()
+### no suffix half the time, otherwise 1-10 with equal odds
+GAMERTAG_SUFFIXES = ("",) + tuple(str(n) for n in range(1, 11))
+GAMERTAG_SUFFIX_WEIGHTS = tuple(accumulate([10] + [1] * 10))
 
-def generate_gamer_tag():
-    word = coolname.generate()[0].capitalize()
-    if random.random() < 0.5:
-        word += str(random.randint(1, 10))
-    return word
 
+def gamertags(count, rng):
+    words = rng.choices(GAMERTAG_WORDS, cum_weights=GAMERTAG_WEIGHTS, k=count)
+    suffixes = rng.choices(
+        GAMERTAG_SUFFIXES, cum_weights=GAMERTAG_SUFFIX_WEIGHTS, k=count
+    )
+    return [word + suffix for word, suffix in zip(words, suffixes)]
 
-def generate_integer(value):
+
+def generate_gamer_tag(rng=random):
+    return gamertags(1, rng)[0]
+
+
+def compile_gamertag(value):
+    return lambda count, columns, rng: gamertags(count, rng)
+
+
+def compile_integer(value):
     low = int(value.get("min", 1))
     high = int(value.get("max", 50000))
-    return random.randint(low, high)
+    if low > high:
+        raise ValueError("integer min must not be greater than max")
 
+    values = range(low, high + 1)
+    return lambda count, columns, rng: rng.choices(values, k=count)
 
-def generate_name(value):
+
+def name_table(elements):
+    ### Faker picks uniformly from a sequence, or by weight from an OrderedDict
+    if isinstance(elements, dict):
+        return tuple(elements), tuple(accumulate(elements.values()))
+    return tuple(elements), None
+
+
+def build_name_tables(fake):
+    """
+    (first names, cum weights, last names, cum weights) read from the
+    locale's person provider, or None when the locale picks names some
+    other way and has to go through Faker.
+    """
+    for provider in fake.get_providers():
+        if isinstance(provider, PersonProvider):
+            break
+    else:
+        return None
+
+    if (
+        type(provider).first_name is not PersonProvider.first_name
+        or type(provider).last_name is not PersonProvider.last_name
+    ):
+        return None
+    return name_table(provider.first_names) + name_table(provider.last_names)
+
+
+NAME_TABLES = build_name_tables(faker)
+
+
+def compile_name(value):
     name_format = value.get("format", "full")
+    if name_format == "gamertag":
+        return lambda count, columns, rng: gamertags(count, rng)
+    if name_format not in ("first", "last", "full"):
+        raise ValueError("invalid name format entered")
+
+    if NAME_TABLES is None:
+        return compile_faker_name(name_format)
+
+    first_names, first_weights, last_names, last_weights = NAME_TABLES
+
+    def firsts(count, rng):
+        return rng.choices(first_names, cum_weights=first_weights, k=count)
+
+    def lasts(count, rng):
+        return rng.choices(last_names, cum_weights=last_weights, k=count)
+
     match name_format:
         case "first":
-            return faker.first_name()
+            return lambda count, columns, rng: firsts(count, rng)
         case "last":
-            return faker.last_name()
+            return lambda count, columns, rng: lasts(count, rng)
         case "full":
-            return f"{faker.first_name()} {faker.last_name()}"
-        case "gamertag":
-            return generate_gamer_tag()
-        case _:
-            raise ValueError("invalid name format entered")
+            return lambda count, columns, rng: [
+                f"{first} {last}"
+                for first, last in zip(firsts(count, rng), lasts(count, rng))
+            ]
 
 
-def generate_dob(value):
+def compile_faker_name(name_format):
+    match name_format:
+        case "first":
+
+            def generate(fake):
+                return fake.first_name()
+
+        case "last":
+
+            def generate(fake):
+                return fake.last_name()
+
+        case "full":
+
+            def generate(fake):
+                return f"{fake.first_name()} {fake.last_name()}"
+
+    def column(count, columns, rng):
+        fake = faker_for(rng)
+        return [generate(fake) for _ in range(count)]
+
+    return column
+
+
+def years_before(day, years):
+    try:
+        return day.replace(year=day.year - years)
+    except ValueError:
+        ### 29 February in a non-leap year
+        return day.replace(year=day.year - years, day=28)
+
+
+def compile_dob(value):
     min_age = int(value.get("min", 1))
     max_age = int(value.get("max", 100))
-    dob = faker.date_of_birth(minimum_age=min_age, maximum_age=max_age)
-    return dob.isoformat()
+    if min_age < 0 or min_age > max_age:
+        raise ValueError("dob min must be 0 or greater and not greater than max")
+    ### the oldest birthday, max_age + 1 years back, must still be a valid date
+    if max_age >= date.today().year - 1:
+        raise ValueError(f"dob max must be less than {date.today().year - 1}")
+
+    def column(count, columns, rng):
+        ### everyone born from the day after turning max_age + 1 years ago up to
+        ### exactly min_age years ago is between min_age and max_age today
+        today = date.today()
+        first = years_before(today, max_age + 1).toordinal() + 1
+        last = years_before(today, min_age).toordinal()
+        return draw_days(first, last)(rng, count)
+
+    return column
+
+
+### same address space Faker draws from: classes a/b/c, RFC 1918 private blocks, and
+### the IANA special-purpose blocks that are never generated
+IPV4_CLASSES = ["0.0.0.0/1", "128.0.0.0/2", "192.0.0.0/3"]
+IPV4_PRIVATE = ["10.0.0.0/8", "172.16.0.0/12", "192.168.0.0/16"]
+IPV4_EXCLUDED = [
+    "0.0.0.0/8",
+    "100.64.0.0/10",
+    "127.0.0.0/8",
+    "169.254.0.0/16",
+    "192.0.0.0/24",
+    "192.0.2.0/24",
+    "192.31.196.0/24",
+    "192.52.193.0/24",
+    "192.88.99.0/24",
+    "192.175.48.0/24",
+    "198.18.0.0/15",
+    "198.51.100.0/24",
+    "203.0.113.0/24",
+    "224.0.0.0/4",
+    "240.0.0.0/4",
+    "255.255.255.255/32",
+]
+
+
+def cidr_intervals(cidrs):
+    ### [(first address, last address)] as integers
+    intervals = []
+    for cidr in cidrs:
+        network = ipaddress.ip_network(cidr)
+        intervals.append((int(network.network_address), int(network.broadcast_address)))
+    return intervals
+
+
+def subtract_intervals(intervals, excluded):
+    for ex_first, ex_last in excluded:
+        remaining = []
+        for first, last in intervals:
+            if ex_last < first or ex_first > last:
+                remaining.append((first, last))
+                continue
+            if first < ex_first:
+                remaining.append((first, ex_first - 1))
+            if ex_last < last:
+                remaining.append((ex_last + 1, last))
+        intervals = remaining
+    return intervals
+
+
+def ipv4_table(per_class):
+    """
+    (cum weights, first addresses, sizes) for picking an interval and then
+    an address in it. per_class is a list of interval lists; like Faker,
+    a class is picked uniformly and then an interval by size within it.
+    """
+    weights = []
+    firsts = []
+    sizes = []
+    for intervals in per_class:
+        total = sum(last - first + 1 for first, last in intervals)
+        for first, last in intervals:
+            weights.append((last - first + 1) / total)
+            firsts.append(first)
+            sizes.append(last - first + 1)
+    return tuple(accumulate(weights)), tuple(firsts), tuple(sizes)
+
+
+def build_ipv4_tables():
+    excluded = cidr_intervals(IPV4_EXCLUDED)
+    private = cidr_intervals(IPV4_PRIVATE)
+    classes = [cidr_intervals([cidr]) for cidr in IPV4_CLASSES]
+    return {
+        "public": ipv4_table(
+            [subtract_intervals(c, excluded + private) for c in classes]
+        ),
+        "private": ipv4_table(
+            [
+                subtract_intervals(
+                    [
+                        (max(first, c[0][0]), min(last, c[0][1]))
+                        for first, last in private
+                        if first <= c[0][1] and last >= c[0][0]
+                    ],
+                    excluded,
+                )
+                for c in classes
+            ]
+        ),
+        "any": ipv4_table(
+            [subtract_intervals(cidr_intervals(["0.0.0.0/0"]), excluded)]
+        ),
+    }
 
 
-def generate_ip(value):
+IPV4_TABLES = build_ipv4_tables()
+
+
+def format_ipv4(n):
+    return f"{n >> 24}.{n >> 16 & 255}.{n >> 8 & 255}.{n & 255}"
+
+
+def format_ipv6(n):
+    ### RFC 5952 text, same as str(IPv6Address(n)): the longest run of two or
+    ### more zero groups (the first one on a tie) becomes "::"
+    digits = f"{n:032x}"
+    groups = [digits[i : i + 4].lstrip("0") or "0" for i in range(0, 32, 4)]
+    if groups.count("0") < 2:
+        return ":".join(groups)
+
+    best_start, best_length, start = -1, 1, None
+    for i, group in enumerate(groups + ["end"]):
+        if group == "0":
+            if start is None:
+                start = i
+        elif start is not None:
+            if i - start > best_length:
+                best_start, best_length = start, i - start
+            start = None
+    if best_start < 0:
+        return ":".join(groups)
+    head = ":".join(groups[:best_start])
+    tail = ":".join(groups[best_start + best_length :])
+    return f"{head}::{tail}"
+
+
+def compile_ip(value):
     version = value.get("version", 4)
     visibility = str(value.get("visibility", None)).lower()
 
-    match (version, visibility):
-        case (4, "public"):
-            return faker.ipv4(private=False)
-        case (4, "private"):
-            return faker.ipv4(private=True)
-        case (6, _):
-            return faker.ipv6()
-        case (4, _):
-            return faker.ipv4()
-        case _:
-            raise ValueError("ip version must be 4 or 6")
+    if version == 6:
+        ### Faker's range: anything above the IPv4-sized space; a 128-bit draw lands
+        ### below it with probability 2**-96, so redraw in that case
+        def draw(getrandbits):
+            n = getrandbits(128)
+            while n < 2**32:
+                n = getrandbits(128)
+            return n
 
+        def column(count, columns, rng):
+            getrandbits = rng.getrandbits
+            return [format_ipv6(draw(getrandbits)) for _ in range(count)]
 
-def generate_country(value):
+        return column
+
+    if version != 4:
+        raise ValueError("ip version must be 4 or 6")
+
+    cum_weights, firsts, sizes = IPV4_TABLES.get(visibility, IPV4_TABLES["any"])
+    indexes = range(len(firsts))
+
+    def column(count, columns, rng):
+        rand = rng.random
+        return [
+            format_ipv4(firsts[i] + int(rand() * sizes[i]))
+            for i in rng.choices(indexes, cum_weights=cum_weights, k=count)
+        ]
+
+    return column
+
+
+def country_table(codes):
+    ### (alpha2, alpha3, name) per code in the given order, plus any unknown codes
+    table = []
+    unknown = []
+    for code in codes:
+        country = iso3166.countries_by_alpha2.get(str(code).upper())
+        if country is None:
+            unknown.append(code)
+        else:
+            table.append((country.alpha2, country.alpha3, country.name))
+    return tuple(table), unknown
+
+
+### the pool faker.country_code() draws from, resolved once
+COUNTRY_TABLE, _ = country_table(
+    next(
+        provider.alpha_2_country_codes
+        for provider in faker.get_providers()
+        if hasattr(provider, "alpha_2_country_codes")
+    )
+)
+
+COUNTRY_FORMATS = {"alpha2": 0, "alpha3": 1, "name": 2}
+
+
+def compile_country(value):
     ### alpha2 = US, alpha3 = USA, name = United States
     country_format = value.get("format", "alpha2")
     countries = value.get("countries", None)
 
-    if countries is not None:
-        option = random.choice(countries)
-        option = option.upper()
+    if country_format not in COUNTRY_FORMATS:
+        raise ValueError("unsupported country format")
+
+    if countries is None:
+        table = COUNTRY_TABLE
     else:
-        option = faker.country_code()
+        if not isinstance(countries, list) or not countries:
+            raise ValueError("countries must be a non-empty list of country codes")
+        table, unknown = country_table(countries)
+        if unknown:
+            raise ValueError(f"unknown country codes: {unknown}")
+
+    index = COUNTRY_FORMATS[country_format]
+    values = tuple(row[index] for row in table)
+    return lambda count, columns, rng: rng.choices(values, k=count)
+
+
+### compilers for types that stand alone; game-dependent types take the game field too
+COMPILERS = {
+    "integer": compile_integer,
+    "name": compile_name,
+    "dob": compile_dob,
+    "ip": compile_ip,
+    "country": compile_country,
+    "gamertag": compile_gamertag,
+}
+
+GAME_COMPILERS = {
+    "role": compile_role,
+    "org": compile_org,
+    "trophies": compile_trophies,
+}
+
+
+def generate_game(value):
+    return compile_game(value)(1, {}, random)[0]
+
+
+def generate_role(value, document, name):
+    if not document.get(name):
+        raise ValueError("role requires 'game' to be generated first")
+    return compile_role(value, name)(1, {name: [document[name]]}, random)[0]
 
-    country = iso3166.countries.get(option)
 
-    match country_format:
-        case "alpha2":
-            return option
-        case "alpha3":
-            return country.alpha3
-        case "name":
-            return country.name
-        case _:
-            raise ValueError("unsupported country format")
+def generate_org(value, document, name):
+    if not document.get(name):
+        raise ValueError("role requires 'game' to be generated first")
+    return compile_org(value, name)(1, {name: [document[name]]}, random)[0]
+
+
+def generate_trophies(value, document, name):
+    if not document.get(name):
+        raise ValueError("role requires 'game' to be generated first")
+    return compile_trophies(value, name)(1, {name: [document[name]]}, random)[0]
+
+
+def generate_integer(value):
+    return compile_integer(value)(1, {}, random)[0]
+
+
+def generate_name(value):
+    return compile_name(value)(1, {}, random)[0]
+
+
+def generate_dob(value):
+    return compile_dob(value)(1, {}, random)[0]
+
+
+def generate_ip(value):
+    return compile_ip(value)(1, {}, random)[0]
+
+
+def generate_country(value):
+    return compile_country(value)(1, {}, random)[0]
+
+
+class SchemaPlan(list):
+    """
+    Ordered (field_name, column) pairs plus the field map they were compiled
+    from. Columns are closures, so pickling re-compiles from the field map;
+    that is how a plan travels to a worker process. template() gives the
+    RowTemplate that renders this plan's rows.
+    """
+
+    def __init__(self, fields, steps):
+        super().__init__(steps)
+        self.fields = fields
+        self.names = [field_name for field_name, _ in steps]
+        self.templates = {}
+
+    def __reduce__(self):
+        return compile_schema, (self.fields,)
+
+    def template(self, sort_keys=False):
+        template = self.templates.get(sort_keys)
+        if template is None:
+            template = self.templates[sort_keys] = RowTemplate(
+                [
+                    (name, VALUE_TYPES.get(self.fields[name]["type"]))
+                    for name in self.names
+                ],
+                sort_keys,
+            )
+        return template
+
+
+def compile_schema(key_pairs):
+    """
+    Turn a stored field map into a generation plan: an ordered list of
+    (field_name, column) pairs with every parameter already parsed.
+    The game field always comes first so role/org/trophies can read it.
+    Raises ValueError for anything make_document would have rejected.
+    """
+    plan = []
+    game = None
+
+    for field_name, value in key_pairs.items():
+        if value["type"] == "game":
+            plan.append((field_name, compile_game(value)))
+            game = field_name
+            break
+
+    for field_name, value in key_pairs.items():
+        if field_name == game:
+            continue
+
+        data_type = value["type"]
+
+        if data_type in COMPILERS:
+            plan.append((field_name, COMPILERS[data_type](value)))
+        elif data_type in GAME_COMPILERS:
+            plan.append((field_name, GAME_COMPILERS[data_type](value, game)))
+        else:
+            raise ValueError(f"Unsupported type: {data_type}")
+
+    return SchemaPlan(key_pairs, plan)
+
+
+def make_rows(key_pairs, count, rng=None):
+    """
+    Generate `count` rows in one go: each field is drawn as a whole column
+    from `rng`, then the columns are zipped into tuples in plan order (see
+    SchemaPlan.names). Accepts either a field map or a plan from
+    compile_schema.
+    """
+    plan = compile_schema(key_pairs) if isinstance(key_pairs, dict) else key_pairs
+    if rng is None:
+        rng = random.Random()
+
+    columns = {}
+    for field_name, column in plan:
+        columns[field_name] = column(count, columns, rng)
+
+    if not columns:
+        return [()] * count
+
+    return list(zip(*columns.values()))
+
+
+def make_documents(key_pairs, count, rng=None):
+    """make_rows() as dicts."""
+    plan = compile_schema(key_pairs) if isinstance(key_pairs, dict) else key_pairs
+    names = plan.names
+    return [dict(zip(names, row)) for row in make_rows(plan, count, rng)]
+
+
+def chunk_rng(seed, chunk_index):
+    ### str seeds are hashed with sha512, so this is stable across processes and runs
+    return random.Random(f"{seed}:{chunk_index}")
+
+
+def iter_rows(key_pairs, count, seed=None, offset=0, batch_size=SEED_CHUNK_SIZE):
+    """
+    Yield lists of rows until `count` have been produced.
+
+    Without a seed, batches of `batch_size` come from a fresh private rng.
+    With a seed, row N always lives in chunk N // SEED_CHUNK_SIZE,
+    generated from chunk_rng(seed, chunk); so the same schema, seed and
+    offset give the same rows, and a window starting at `offset`
+    only generates the chunks it overlaps. Values relative to today
+    (dob, the default trophies end_year) naturally move with the date.
+    """
+    plan = compile_schema(key_pairs) if isinstance(key_pairs, dict) else key_pairs
+
+    if seed is None:
+        rng = random.Random()
+        for start in range(0, count, batch_size):
+            yield make_rows(plan, min(batch_size, count - start), rng)
+        return
+
+    end = offset + count
+    for chunk_index in range(offset // SEED_CHUNK_SIZE, -(-end // SEED_CHUNK_SIZE)):
+        chunk_start = chunk_index * SEED_CHUNK_SIZE
+        rows = make_rows(plan, SEED_CHUNK_SIZE, chunk_rng(seed, chunk_index))
+        yield rows[
+            max(offset - chunk_start, 0) : min(end - chunk_start, SEED_CHUNK_SIZE)
+        ]
+
+
+def iter_documents(key_pairs, count, seed=None, offset=0, batch_size=SEED_CHUNK_SIZE):
+    """iter_rows() as lists of dicts; the same seed gives the same documents."""
+    plan = compile_schema(key_pairs) if isinstance(key_pairs, dict) else key_pairs
+    names = plan.names
+    for rows in iter_rows(plan, count, seed, offset, batch_size):
+        yield [dict(zip(names, row)) for row in rows]
 
 
 def make_document(key_pairs):
     """
+    Accepts either a field map or a plan from compile_schema.
     {
       "schema_name": "Haroldas's Generator",
       "fields": {
@@ -267,44 +890,7 @@ def make_document(key_pairs):
       }
     }
     """
-
-    document = {}
-    game = None
-
-    for field_name, value in key_pairs.items():
-        if value["type"] == "game":
-            document[field_name] = generate_game(value)
-            game = field_name
-            break
-
-    for field_name, value in key_pairs.items():
-        if field_name == game:
-            continue
-
-        data_type = value["type"]
-
-        match data_type:
-            case "integer":
-                document[field_name] = generate_integer(value)
-            case "name":
-                document[field_name] = generate_name(value)
-            case "dob":
-                document[field_name] = generate_dob(value)
-            case "ip":
-                document[field_name] = generate_ip(value)
-            case "country":
-                document[field_name] = generate_country(value)
-
-            case "role":
-                document[field_name] = generate_role(value, document, game)
-            case "org":
-                document[field_name] = generate_org(value, document, game)
-            case "trophies":
-                document[field_name] = generate_trophies(value, document, game)
-            case _:
-                raise ValueError(f"Unsupported type: {data_type}")
-
-    return document
+    return make_documents(key_pairs, 1)[0]
 
 
 def process_fields(fields):
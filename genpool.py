@@ -0,0 +1,187 @@
+import multiprocessing
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from generators import iter_documents, iter_rows, make_documents, SEED_CHUNK_SIZE
+from serializer import RowTemplate
+from logsetup import setup_logging, get_logger
+
+setup_logging()
+log = get_logger(__name__)
+
+### 0 workers disables the pool; requests below the threshold always run in-process
+GEN_POOL_WORKERS = int(os.environ.get("GEN_POOL_WORKERS", "0"))
+GEN_POOL_THRESHOLD = int(os.environ.get("GEN_POOL_THRESHOLD", "50000"))
+GEN_POOL_CHUNK_SIZE = int(os.environ.get("GEN_POOL_CHUNK_SIZE", "10000"))
+### forkserver avoids forking a process that has waitress threads mid-request
+GEN_POOL_START_METHOD = os.environ.get("GEN_POOL_START_METHOD", "forkserver")
+
+WARM_SCHEMA = {
+    "game": {"type": "game"},
+    "name": {"type": "name", "format": "gamertag"},
+    "dob": {"type": "dob"},
+    "ip": {"type": "ip"},
+    "country": {"type": "country", "format": "name"},
+    "trophies": {"type": "trophies", "max": 1},
+}
+
+executor = None
+executor_lock = threading.Lock()
+
+
+def warm_worker():
+    ### builds this process's Faker/coolname instances before the first real chunk
+    make_documents(WARM_SCHEMA, 1, random.Random())
+
+
+def get_executor(workers=None):
+    global executor
+    with executor_lock:
+        if executor is None:
+            executor = ProcessPoolExecutor(
+                max_workers=workers or GEN_POOL_WORKERS,
+                mp_context=multiprocessing.get_context(GEN_POOL_START_METHOD),
+                initializer=warm_worker,
+            )
+            log.info(
+                "action=pool.start component=genpool outcome=success workers=%s start_method=%s",
+                workers or GEN_POOL_WORKERS,
+                GEN_POOL_START_METHOD,
+            )
+        return executor
+
+
+def shutdown():
+    global executor
+    with executor_lock:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+            executor = None
+
+
+def discard_executor(pool):
+    ### a pool that lost a worker stays broken; drop it so the next request starts a new one
+    global executor
+    with executor_lock:
+        if executor is pool:
+            executor = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def encode_batches(plan, count, seed, offset, encode, batch_size=SEED_CHUNK_SIZE):
+    """
+    Yield lists of encoded documents generated in-process. A RowTemplate
+    renders rows straight to lines; any other encode is called per document.
+    """
+    if isinstance(encode, RowTemplate):
+        for rows in iter_rows(plan, count, seed, offset, batch_size):
+            yield encode.lines(rows)
+        return
+    for documents in iter_documents(plan, count, seed, offset, batch_size):
+        yield list(map(encode, documents))
+
+
+def generate_chunk(plan, count, seed, offset, encode):
+    """
+    Worker entry point: generate and encode one chunk. Returns the encoded
+    lines with the worker's pid and generation time for the parent to log.
+    """
+    time_start = time.monotonic()
+    lines = [
+        line
+        for batch in encode_batches(plan, count, seed, offset, encode)
+        for line in batch
+    ]
+    time_diff = (time.monotonic() - time_start) * 1000
+    return lines, os.getpid(), time_diff
+
+
+def chunk_windows(count, offset, chunk_size):
+    ### seeded chunks must not straddle tasks, so windows are aligned to SEED_CHUNK_SIZE
+    chunk_size = max(chunk_size // SEED_CHUNK_SIZE, 1) * SEED_CHUNK_SIZE
+    start = offset
+    end = offset + count
+    while start < end:
+        stop = min(end, (start // chunk_size + 1) * chunk_size)
+        yield start, stop - start
+        start = stop
+
+
+def iter_encoded(
+    plan,
+    count,
+    seed,
+    offset,
+    encode,
+    batch_size,
+    workers=None,
+    threshold=None,
+    chunk_size=None,
+):
+    """
+    Yield lists of encoded documents, in order. `encode` is a per-document
+    function or a RowTemplate (see encode_batches). Large requests are split
+    into chunks and generated in the process pool with at most two chunks
+    per worker in flight; everything else is generated in-process. If a
+    worker dies the request fails and the pool is replaced for the next one.
+    """
+    workers = GEN_POOL_WORKERS if workers is None else workers
+    threshold = GEN_POOL_THRESHOLD if threshold is None else threshold
+    chunk_size = GEN_POOL_CHUNK_SIZE if chunk_size is None else chunk_size
+
+    if workers < 1 or count < threshold:
+        yield from encode_batches(plan, count, seed, offset, encode, batch_size)
+        return
+
+    pool = get_executor(workers)
+    windows = chunk_windows(count, offset, chunk_size)
+    pending = deque()
+    try:
+        for start, size in windows:
+            pending.append(
+                (
+                    start,
+                    size,
+                    time.monotonic(),
+                    pool.submit(generate_chunk, plan, size, seed, start, encode),
+                )
+            )
+            if len(pending) < workers * 2:
+                continue
+
+            yield collect_chunk(*pending.popleft())
+
+        while pending:
+            yield collect_chunk(*pending.popleft())
+    except BrokenProcessPool:
+        log.exception(
+            "action=pool.chunk component=genpool outcome=broken_pool count=%s pending=%s",
+            count,
+            len(pending),
+        )
+        discard_executor(pool)
+        raise
+    finally:
+        for _, _, _, future in pending:
+            future.cancel()
+
+
+def collect_chunk(start, size, submitted_at, future):
+    time_start = time.monotonic()
+    lines, worker, generate_ms = future.result()
+    time_done = time.monotonic()
+    log.info(
+        "action=pool.chunk component=genpool outcome=success offset=%s count=%s worker=%s generate_ms=%.1f wait_ms=%.1f duration_ms=%.1f",
+        start,
+        size,
+        worker,
+        generate_ms,
+        (time_done - time_start) * 1000,
+        (time_done - submitted_at) * 1000,
+    )
+    return lines
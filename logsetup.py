@@ -1,31 +1,229 @@
+import atexit
+import itertools
 import json
 import logging
+import logging.handlers
 import os
+import queue
+import random
+import re
 import sys
 from datetime import datetime, timezone
+from functools import lru_cache, partial
 
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
 
-def time_now():
-    return datetime.now(timezone.utc).isoformat()
+PLACEHOLDER = re.compile(r"%(?:%|[-#0 +]*\d*(?:\.(\d+))?([sdifrxXeEgGc]))")
+FIELD_TYPES = {str, int, float, bool, type(None)}
+### how message_plan() says to read each field
+LITERAL, ARG, ROUND, INT, TEXT = range(5)
+
+if orjson is not None:
+
+    def encode_json(doc):
+        return orjson.dumps(doc, default=str).decode()
+
+else:  # pragma: no cover
+    encode_json = partial(json.dumps, ensure_ascii=False, default=str)
+
+
+def literal(text):
+    for convert in (int, float):
+        try:
+            return convert(text)
+        except ValueError:
+            pass
+    return text
+
+
+@lru_cache(maxsize=1024)
+def message_plan(template, has_args):
+    """
+    Compile a "key=value key=%s ..." message template into the number of
+    args it takes and a (key, how, a, b) per key=value token, so each
+    record only has to pick its values out of args.
+    """
+    plan = []
+    index = 0
+    for token in template.split(" "):
+        key, sep, text = token.partition("=")
+        matches = PLACEHOLDER.findall(token) if has_args else []
+        placeholders = sum(kind != "" for _, kind in matches)
+        start = index
+        index += placeholders
+        if not sep or not key.replace(".", "_").isidentifier():
+            continue
+        if not placeholders:
+            plan.append((key, LITERAL, literal(text), None))
+        elif placeholders == 1 and PLACEHOLDER.fullmatch(text):
+            digits, kind = matches[0]
+            if kind in "fF":
+                plan.append((key, ROUND, start, int(digits or 6)))
+            elif kind in "di":
+                plan.append((key, INT, start, None))
+            else:
+                plan.append((key, ARG, start, None))
+        else:
+            plan.append((key, TEXT, slice(start, index), text))
+    return index, plan
+
+
+def record_fields(record):
+    """
+    The key=value pairs of a record as a dict. Values come straight from
+    the record's args, so numbers stay numbers and %.1f keeps its rounding.
+    Returns None when the args do not line up with the message.
+    """
+    args = record.args
+    if not isinstance(args, tuple):
+        return None
+    count, plan = message_plan(str(record.msg), bool(args))
+    if len(args) != count:
+        return None
+    fields = {}
+    for key, how, a, b in plan:
+        if how == ARG:
+            value = args[a]
+            fields[key] = value if type(value) in FIELD_TYPES else str(value)
+        elif how == ROUND:
+            fields[key] = round(float(args[a]), b)
+        elif how == LITERAL:
+            fields[key] = a
+        elif how == INT:
+            fields[key] = int(args[a])
+        else:
+            fields[key] = b % args[a]
+    return fields
 
 
 class JsonFormatter(logging.Formatter):
+    """
+    One JSON document per record. key=value pairs in the message are also
+    emitted as fields under "app", and @timestamp comes from the record's
+    creation time, formatted once per second.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.cached_second = None
+        self.cached_prefix = ""
+
+    def timestamp(self, created):
+        second = int(created)
+        if second != self.cached_second:
+            self.cached_prefix = datetime.fromtimestamp(second, timezone.utc).strftime(
+                "%Y-%m-%dT%H:%M:%S"
+            )
+            self.cached_second = second
+        return "%s.%06d+00:00" % (self.cached_prefix, (created - second) * 1e6)
+
     def format(self, record: logging.LogRecord):
+        message = record.getMessage()
         doc = {
-            "@timestamp": time_now(),
+            "@timestamp": self.timestamp(record.created),
             "log.level": record.levelname.lower(),  # severity of event
-            "message": record.getMessage(),  # log message
+            "message": message,  # log message
             "logger": record.name,
         }
+        try:
+            fields = record_fields(record)
+        except (TypeError, ValueError):
+            fields = None
+        if fields:
+            doc["app"] = fields
 
         if record.exc_info:
             doc.setdefault("app", {})
             doc["app"]["exception"] = {
                 "type": record.exc_info[0].__name__,
-                "message": record.getMessage(),
+                "message": message,
                 "stack_trace": self.formatException(record.exc_info),
             }
-        return json.dumps(doc, ensure_ascii=False)
+        return encode_json(doc)
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keep only a fraction of the INFO/DEBUG lines of each sampled action,
+    e.g. {"db.query_one": 0.01}. Warnings and errors are always kept, as
+    are lines whose action has no rate.
+    """
+
+    def __init__(self, rates):
+        super().__init__()
+        self.rates = rates
+        self.random = random.Random()
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        msg = record.msg
+        if not isinstance(msg, str) or not msg.startswith("action="):
+            return True
+        rate = self.rates.get(msg[7:].split(" ", 1)[0])
+        return rate is None or self.random.random() < rate
+
+
+class DropQueueHandler(logging.handlers.QueueHandler):
+    """
+    Queue records for a QueueListener without ever blocking the caller:
+    when the queue is full the record is dropped and counted, and the
+    count is reported in a warning once the queue has room again.
+    """
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.drops = itertools.count()
+        self.dropped = 0
+        self.reported = 0
+
+    def prepare(self, record):
+        ### the queue is in-process, so the record goes through untouched: JsonFormatter
+        ### needs msg and args apart, and all formatting happens on the listener's thread
+        return record
+
+    def enqueue(self, record):
+        try:
+            if self.dropped != self.reported:
+                self.report_drops()
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped = next(self.drops) + 1
+
+    def report_drops(self):
+        dropped = self.dropped
+        self.queue.put_nowait(
+            logging.LogRecord(
+                __name__,
+                logging.WARNING,
+                __file__,
+                0,
+                "action=log.dropped component=logging dropped=%s since_last=%s"
+                % (dropped, dropped - self.reported),
+                None,
+                None,
+            )
+        )
+        self.reported = dropped
+
+
+class DrainingQueueListener(logging.handlers.QueueListener):
+    def enqueue_sentinel(self):
+        ### wait for room rather than fail at exit when the queue is full
+        self.queue.put(self._sentinel)
+
+
+def parse_sample_rates(value):
+    """Parse "db.query_one=0.01,db.execute=0.1" into {"db.query_one": 0.01, ...}."""
+    rates = {}
+    for item in value.split(","):
+        if item.strip():
+            action, rate = item.split("=", 1)
+            rates[action.strip()] = float(rate)
+    return rates
 
 
 def setup_logging():
@@ -47,7 +245,24 @@ def setup_logging():
             logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s")
         )
 
-    root_logger.addHandler(stdout_handler)
+    ### LOG_ASYNC moves formatting and stdout writes to a listener thread behind a
+    ### queue of LOG_QUEUE_SIZE records; callers never block on a slow stdout
+    handler = stdout_handler
+    if os.getenv("LOG_ASYNC", "false").lower() == "true":
+        handler = DropQueueHandler(
+            queue.Queue(int(os.getenv("LOG_QUEUE_SIZE", "10000")))
+        )
+        listener = DrainingQueueListener(
+            handler.queue, stdout_handler, respect_handler_level=True
+        )
+        listener.start()
+        atexit.register(listener.stop)
+
+    rates = parse_sample_rates(os.getenv("LOG_SAMPLE_RATES", ""))
+    if rates:
+        handler.addFilter(SamplingFilter(rates))
+
+    root_logger.addHandler(handler)
 
 
 def get_logger(name: str):
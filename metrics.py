@@ -0,0 +1,364 @@
+import bisect
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from logsetup import setup_logging, get_logger
+
+setup_logging()
+log = get_logger(__name__)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+LATENCY_BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1,
+    2.5,
+    5,
+    10,
+    30,
+)
+
+
+def format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+def format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (
+        (
+            name,
+            str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"),
+        )
+        for name, value in pairs
+    )
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+
+class Metric:
+    """
+    Base for counters and histograms. Each thread updates its own shard of
+    values, so the hot path takes no lock; collect() merges the shards.
+    """
+
+    kind = None
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.local = threading.local()
+        self.shards = []
+        self.lock = threading.Lock()
+
+    def shard(self):
+        try:
+            return self.local.values
+        except AttributeError:
+            values = self.local.values = {}
+            with self.lock:
+                self.shards.append(values)
+            return values
+
+    def key(self, labels):
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def snapshots(self):
+        with self.lock:
+            shards = list(self.shards)
+        ### dict.items() is copied under the GIL, so a writer cannot resize it midway
+        return [list(shard.items()) for shard in shards]
+
+    def snapshot(self):
+        """A JSON-serialisable copy of the metric, see render_snapshot()."""
+        return {
+            "kind": self.kind,
+            "help": self.help,
+            "labelnames": list(self.labelnames),
+            "samples": [[list(key), value] for key, value in self.collect().items()],
+        }
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        values = self.shard()
+        key = self.key(labels)
+        values[key] = values.get(key, 0) + amount
+
+    def collect(self):
+        totals = {}
+        for items in self.snapshots():
+            for key, value in items:
+                totals[key] = totals.get(key, 0) + value
+        return totals
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        values = self.shard()
+        key = self.key(labels)
+        entry = values.get(key)
+        if entry is None:
+            entry = values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        entry[0][bisect.bisect_left(self.buckets, value)] += 1
+        entry[1] += value
+        entry[2] += 1
+
+    def collect(self):
+        """Merged [bucket counts, sum, count] per label values (not cumulative)."""
+        totals = {}
+        for items in self.snapshots():
+            for key, (counts, total, count) in items:
+                merged = totals.setdefault(key, [[0] * len(counts), 0.0, 0])
+                merged[0] = [a + b for a, b in zip(merged[0], counts)]
+                merged[1] += total
+                merged[2] += count
+        return totals
+
+    def quantile(self, q, **labels):
+        """
+        Estimate the q-quantile by interpolating within its bucket, as
+        histogram_quantile does. Returns None before any observation.
+        """
+        entry = self.collect().get(self.key(labels))
+        if entry is None or not entry[2]:
+            return None
+        counts, _, count = entry
+        rank = q * count
+        seen = 0
+        for i, bucket_count in enumerate(counts):
+            if seen + bucket_count >= rank and bucket_count:
+                if i == len(self.buckets):
+                    return self.buckets[-1]
+                lower = self.buckets[i - 1] if i else 0
+                return lower + (self.buckets[i] - lower) * (rank - seen) / bucket_count
+            seen += bucket_count
+        return self.buckets[-1]
+
+    def snapshot(self):
+        return dict(super().snapshot(), buckets=list(self.buckets))
+
+
+class Gauge(Metric):
+    """
+    A value that goes up and down. Gauges change rarely next to counters,
+    so they sit behind a lock; set_function() reads the value at scrape time.
+    """
+
+    kind = "gauge"
+
+    def __init__(self, name, help, labelnames=()):
+        super().__init__(name, help, labelnames)
+        self.values = {}
+        self.functions = {}
+
+    def inc(self, amount=1, **labels):
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value, **labels):
+        with self.lock:
+            self.values[self.key(labels)] = value
+
+    def set_function(self, function, **labels):
+        with self.lock:
+            self.functions[self.key(labels)] = function
+
+    def collect(self):
+        with self.lock:
+            values = dict(self.values)
+            functions = dict(self.functions)
+        for key, function in functions.items():
+            values[key] = function()
+        return values
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+        self.lock = threading.Lock()
+
+    def register(self, metric):
+        with self.lock:
+            if metric.name in self.metrics:
+                raise ValueError(f"Metric {metric.name!r} is already registered")
+            self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, help, labelnames=()):
+        return self.register(Counter(name, help, labelnames))
+
+    def histogram(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, help, labelnames, buckets))
+
+    def gauge(self, name, help, labelnames=()):
+        return self.register(Gauge(name, help, labelnames))
+
+    def snapshot(self):
+        with self.lock:
+            metrics = list(self.metrics.values())
+        return {metric.name: metric.snapshot() for metric in metrics}
+
+    def render(self):
+        """The registry in the Prometheus text exposition format."""
+        return render_snapshot(self.snapshot())
+
+    def write_snapshot(self, directory):
+        """
+        Atomically replace this process's <pid>.json in directory, for
+        merge_snapshots() to combine with the other worker processes.
+        """
+        path = os.path.join(directory, f"{os.getpid()}.json")
+        with open(path + ".tmp", "w") as f:
+            json.dump(self.snapshot(), f)
+        os.replace(path + ".tmp", path)
+
+
+REGISTRY = Registry()
+
+
+def render_snapshot(snapshot):
+    lines = []
+    for name, metric in snapshot.items():
+        lines.append(f"# HELP {name} {metric['help']}")
+        lines.append(f"# TYPE {name} {metric['kind']}")
+        labelnames = metric["labelnames"]
+        for key, value in sorted(metric["samples"]):
+            if metric["kind"] != "histogram":
+                lines.append(
+                    f"{name}{format_labels(labelnames, key)} {format_value(value)}"
+                )
+                continue
+            counts, total, count = value
+            cumulative = 0
+            for bound, bucket_count in zip(metric["buckets"] + [float("inf")], counts):
+                cumulative += bucket_count
+                labels = format_labels(labelnames, key, [("le", format_value(bound))])
+                lines.append(f"{name}_bucket{labels} {cumulative}")
+            labels = format_labels(labelnames, key)
+            lines.append(f"{name}_sum{labels} {format_value(total)}")
+            lines.append(f"{name}_count{labels} {count}")
+    return "\n".join(lines) + "\n"
+
+
+def pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def merge_snapshots(directory):
+    """
+    Combine every process's snapshot in directory: counters and
+    histograms are summed across all of them (so totals survive a worker
+    restart), gauges only across processes that are still running.
+    """
+    merged = {}
+    for file_name in sorted(os.listdir(directory)):
+        if not file_name.endswith(".json"):
+            continue
+        try:
+            with open(os.path.join(directory, file_name)) as f:
+                snapshot = json.load(f)
+        except (OSError, ValueError):
+            continue
+        live = pid_alive(int(file_name[:-5]))
+        for name, metric in snapshot.items():
+            if metric["kind"] == "gauge" and not live:
+                continue
+            samples = merged.setdefault(name, dict(metric, samples={}))["samples"]
+            for key, value in metric["samples"]:
+                key = tuple(key)
+                current = samples.get(key)
+                if current is None:
+                    samples[key] = value
+                elif metric["kind"] == "histogram":
+                    samples[key] = [
+                        [a + b for a, b in zip(current[0], value[0])],
+                        current[1] + value[1],
+                        current[2] + value[2],
+                    ]
+                else:
+                    samples[key] = current + value
+    for metric in merged.values():
+        metric["samples"] = [
+            [list(key), value] for key, value in metric["samples"].items()
+        ]
+    return merged
+
+
+def serve(port, host="127.0.0.1", registry=REGISTRY):
+    """Serve GET /metrics from a daemon thread. Returns the server."""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = registry.render().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    log.info(
+        "action=metrics.serve component=metrics outcome=started metrics_host=%s metrics_port=%s",
+        host,
+        server.server_port,
+    )
+    return server
+
+
+def every(interval, function):
+    """Call function every interval seconds from a daemon thread."""
+
+    def loop():
+        while True:
+            time.sleep(interval)
+            try:
+                function()
+            except Exception:
+                log.exception("action=metrics.periodic component=metrics outcome=error")
+
+    thread = threading.Thread(target=loop, daemon=True)
+    thread.start()
+    return thread
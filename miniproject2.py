@@ -1,20 +1,202 @@
 from flask import Flask, request, jsonify, Response
+from flask.json.provider import DefaultJSONProvider
+from collections import OrderedDict
+from functools import partial
 import json
+import os
+import threading
 import time
 import pymysql
+from werkzeug.wsgi import ClosingIterator
 
 from db import DB
-from generators import make_document, process_fields, ALLOWED_TYPES
+import genpool
+import metrics
+import serializer
+from generators import process_fields, compile_schema, ALLOWED_TYPES
 from logsetup import setup_logging, get_logger
 
 setup_logging()
 log = get_logger(__name__)
 
+
+class JsonProvider(DefaultJSONProvider):  # pragma: no cover
+    """
+    jsonify through serializer.dumps: compact and key-sorted as before, but
+    non-ASCII is written as UTF-8 rather than escaped. Indented debug
+    output and dumps() calls with extra arguments still use json.dumps.
+    """
+
+    ensure_ascii = False
+
+    def dumps(self, obj, **kwargs):
+        if kwargs:
+            return super().dumps(obj, **kwargs)
+        return serializer.dumps(obj, self.sort_keys, self.default).decode()
+
+    def response(self, *args, **kwargs):
+        if self.compact is False or (self.compact is None and self._app.debug):
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(
+            serializer.dumps(obj, self.sort_keys, self.default) + b"\n",
+            mimetype=self.mimetype,
+        )
+
+
 app = Flask(__name__)
+app.json = JsonProvider(app)
 
 db = DB()
 db.init_schema()
 
+### with METRICS_DIR set, each server process writes its metrics there every
+### METRICS_SNAPSHOT_INTERVAL seconds and /metrics merges all of them
+METRICS_DIR = os.environ.get("METRICS_DIR")
+METRICS_SNAPSHOT_INTERVAL = float(os.environ.get("METRICS_SNAPSHOT_INTERVAL", "5"))
+
+REQUEST_SECONDS = metrics.REGISTRY.histogram(
+    "api_request_seconds",
+    "Request latency, until the last byte of the body is sent.",
+    ["route", "method", "status"],
+)
+REQUESTS_IN_FLIGHT = metrics.REGISTRY.gauge(
+    "api_requests_in_flight", "Requests being handled."
+)
+DOCUMENTS = metrics.REGISTRY.counter(
+    "api_documents_total", "Documents generated.", ["schema"]
+)
+DOCUMENT_BYTES = metrics.REGISTRY.counter(
+    "api_document_bytes_total", "Document bytes written.", ["schema"]
+)
+DB_SECONDS = metrics.REGISTRY.histogram(
+    "api_db_seconds", "Time spent in db.DB queries.", ["action", "outcome"]
+)
+db.hooks.append(
+    lambda action, outcome, time_diff: DB_SECONDS.observe(
+        time_diff / 1000, action=action, outcome=outcome
+    )
+)
+if METRICS_DIR:
+    os.makedirs(METRICS_DIR, exist_ok=True)
+    metrics.every(
+        METRICS_SNAPSHOT_INTERVAL,
+        partial(metrics.REGISTRY.write_snapshot, METRICS_DIR),
+    )
+
+### documents encoded per chunk when streaming /generate-documents
+STREAM_BATCH_SIZE = int(os.environ.get("STREAM_BATCH_SIZE", "500"))
+### mime -> (content type, sort_keys, opening, separator, closing). Documents are
+### rendered from rows by the plan's RowTemplate; the json array sorts keys like
+### jsonify does.
+STREAM_FORMATS = {
+    "ndjson": ("application/x-ndjson", False, b"", b"\n", b"\n"),
+    "json": ("application/json", True, b"[", b",", b"]\n"),
+}
+
+SCHEMA_CACHE_SIZE = int(os.environ.get("SCHEMA_CACHE_SIZE", "128"))
+SCHEMA_CACHE_TTL = float(os.environ.get("SCHEMA_CACHE_TTL", "300"))
+### how often a cached schema is re-checked against `updated_at` (other replicas may change it)
+SCHEMA_CACHE_CHECK_INTERVAL = float(os.environ.get("SCHEMA_CACHE_CHECK_INTERVAL", "2"))
+
+
+class RequestMetrics:  # pragma: no cover
+    """
+    WSGI middleware that times each request until its body is fully sent,
+    so streamed responses count in full. Requests are labelled with the
+    matched route rule rather than the raw path.
+    """
+
+    def __init__(self, wsgi_app):
+        self.wsgi_app = wsgi_app
+
+    def __call__(self, environ, start_response):
+        time_start = time.monotonic()
+        state = {"status": "500"}
+
+        def capture_status(status, headers, exc_info=None):
+            state["status"] = status.split(" ", 1)[0]
+            return start_response(status, headers, exc_info)
+
+        def finish():
+            REQUESTS_IN_FLIGHT.dec()
+            REQUEST_SECONDS.observe(
+                time.monotonic() - time_start,
+                route=environ.get("metrics.route", "unmatched"),
+                method=environ["REQUEST_METHOD"],
+                status=state["status"],
+            )
+
+        REQUESTS_IN_FLIGHT.inc()
+        try:
+            body = self.wsgi_app(environ, capture_status)
+        except Exception:
+            finish()
+            raise
+        return ClosingIterator(body, finish)
+
+
+app.wsgi_app = RequestMetrics(app.wsgi_app)
+
+
+@app.before_request  # pragma: no cover
+def label_route():  # pragma: no cover
+    request.environ["metrics.route"] = (
+        request.url_rule.rule if request.url_rule else "unmatched"
+    )
+
+
+class SchemaCache:
+    """
+    LRU of compiled schemas keyed by name. Each entry is
+    (plan, version, loaded_at, checked_at); entries older than ttl are
+    reloaded, and entries not checked within check_interval are compared
+    against the row's current version before being served.
+    """
+
+    def __init__(self, max_size, ttl, check_interval):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.check_interval = check_interval
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, schema_name):
+        with self.lock:
+            entry = self.entries.get(schema_name)
+            if entry is not None:
+                self.entries.move_to_end(schema_name)
+            return entry
+
+    def put(self, schema_name, entry):
+        with self.lock:
+            self.entries[schema_name] = entry
+            self.entries.move_to_end(schema_name)
+            evicted = []
+            while len(self.entries) > self.max_size:
+                evicted.append(self.entries.popitem(last=False)[0])
+
+        for name in evicted:
+            log.info(
+                "action=schema.cache component=api outcome=evict schema=%s size=%s",
+                name,
+                self.max_size,
+            )
+
+    def touch(self, schema_name, entry, checked_at):
+        with self.lock:
+            if self.entries.get(schema_name) is entry:
+                self.entries[schema_name] = entry[:3] + (checked_at,)
+
+    def discard(self, schema_name):
+        with self.lock:
+            self.entries.pop(schema_name, None)
+
+
+schema_cache = SchemaCache(
+    SCHEMA_CACHE_SIZE, SCHEMA_CACHE_TTL, SCHEMA_CACHE_CHECK_INTERVAL
+)
+
 
 def fetch_schema_by_name(schema_name):  # pragma: no cover
     row = db.query_one("SELECT `fields` FROM `schemas` WHERE `name`=%s", (schema_name,))
@@ -24,6 +206,68 @@ def fetch_schema_by_name(schema_name):  # pragma: no cover
         return None
 
 
+def fetch_schema_version(schema_name):
+    row = db.query_one(
+        "SELECT `id`, `updated_at` FROM `schemas` WHERE `name`=%s", (schema_name,)
+    )
+    if row:
+        return row["id"], row["updated_at"]
+    else:
+        return None
+
+
+def load_schema_plan(schema_name):
+    time_start = time.monotonic()
+    entry = schema_cache.get(schema_name)
+    outcome = "miss"
+
+    if entry is not None:
+        plan, version, loaded_at, checked_at = entry
+        if time_start - loaded_at >= schema_cache.ttl:
+            outcome = "expired"
+        elif time_start - checked_at < schema_cache.check_interval:
+            outcome = "hit"
+        elif fetch_schema_version(schema_name) == version:
+            schema_cache.touch(schema_name, entry, time_start)
+            outcome = "hit"
+        else:
+            outcome = "stale"
+
+    if outcome == "hit":
+        time_diff = (time.monotonic() - time_start) * 1000
+        log.info(
+            "action=schema.cache component=api outcome=hit schema=%s duration_ms=%.1f",
+            schema_name,
+            time_diff,
+        )
+        return plan
+
+    row = db.query_one(
+        "SELECT `id`, `fields`, `updated_at` FROM `schemas` WHERE `name`=%s",
+        (schema_name,),
+    )
+    schema_fields = json.loads(row["fields"]) if row else None
+    if not schema_fields:
+        schema_cache.discard(schema_name)
+        plan = None
+    else:
+        plan = compile_schema(schema_fields)
+        schema_cache.put(
+            schema_name,
+            (plan, (row["id"], row["updated_at"]), time_start, time_start),
+        )
+
+    time_diff = (time.monotonic() - time_start) * 1000
+    log.info(
+        "action=schema.cache component=api outcome=%s schema=%s found=%s duration_ms=%.1f",
+        outcome,
+        schema_name,
+        plan is not None,
+        time_diff,
+    )
+    return plan
+
+
 def insert_schema(schema_name, field_map):  # pragma: no cover
     try:
         db.execute(
@@ -48,8 +292,8 @@ def extract_schema_field_and_count(data):  # pragma: no cover
     if not isinstance(schema_name, str) or not schema_name.strip():
         return jsonify(Error="schema_name must be a non_empty string"), 400
 
-    schema_fields = fetch_schema_by_name(schema_name)
-    if not schema_fields:
+    plan = load_schema_plan(schema_name)
+    if not plan:
         return jsonify(Error="schema not found", schema_name=schema_name), 404
 
     try:
@@ -60,7 +304,25 @@ def extract_schema_field_and_count(data):  # pragma: no cover
     if count < 1:
         return jsonify(Error="Count must be greater than 0"), 400
 
-    return schema_fields, count
+    seed = data.get("seed")
+    if seed is not None and (
+        isinstance(seed, bool) or not isinstance(seed, (int, str))
+    ):
+        return jsonify(Error="seed must be an integer or a string"), 400
+
+    offset = data.get("offset", 0)
+    try:
+        offset = int(offset)
+    except (TypeError, ValueError):
+        return jsonify(Error="offset must be an integer that's 0 or greater"), 400
+
+    if offset < 0:
+        return jsonify(Error="offset must be 0 or greater"), 400
+
+    if offset and seed is None:
+        return jsonify(Error="offset requires a seed"), 400
+
+    return plan, count, seed, offset
 
 
 def extract_schema_name_and_fields(data):  # pragma: no cover
@@ -92,9 +354,75 @@ def extract_schema_name_and_fields(data):  # pragma: no cover
             Error="unknown data types",
         ), 400
 
+    try:
+        compile_schema(field_map)
+    except (TypeError, ValueError) as e:
+        return jsonify(Error=str(e), schema_name=schema_name), 400
+
     return schema_name, field_map
 
 
+def stream_documents(
+    plan, count, seed, offset, mime, schema_name, time_start
+):  # pragma: no cover
+    """
+    Yield the response body one batch of documents at a time (STREAM_BATCH_SIZE,
+    seeded chunks, or pool chunks for large counts) so memory stays flat
+    regardless of count. The request is logged once the last chunk is sent
+    (or the client goes away).
+    """
+    _, sort_keys, opening, separator, closing = STREAM_FORMATS[mime]
+    encode = plan.template(sort_keys)
+    first_byte_ms = None
+    sent = 0
+    size = 0
+    outcome = "aborted"
+    try:
+        prefix = opening
+        for lines in genpool.iter_encoded(
+            plan, count, seed, offset, encode, STREAM_BATCH_SIZE
+        ):
+            chunk = prefix + separator.join(lines)
+            if first_byte_ms is None:
+                first_byte_ms = (time.monotonic() - time_start) * 1000
+            yield chunk
+            sent += len(lines)
+            size += len(chunk)
+            prefix = separator
+        yield closing
+        size += len(closing)
+        outcome = "success"
+    except Exception:
+        outcome = "error"
+        time_diff = (time.monotonic() - time_start) * 1000
+        log.exception(
+            "action=docs.generate component=api outcome=error schema=%s count=%s sent=%s mime=%s duration_ms=%.1f",
+            schema_name,
+            count,
+            sent,
+            mime,
+            time_diff,
+        )
+        raise
+    finally:
+        DOCUMENTS.inc(sent, schema=schema_name)
+        DOCUMENT_BYTES.inc(size, schema=schema_name)
+        if outcome != "error":
+            time_diff = (time.monotonic() - time_start) * 1000
+            log.info(
+                "action=docs.generate component=api outcome=%s status=200 schema=%s count=%s sent=%s seed=%s offset=%s mime=%s first_byte_ms=%.1f duration_ms=%.1f",
+                outcome,
+                schema_name,
+                count,
+                sent,
+                seed,
+                offset,
+                mime,
+                first_byte_ms or 0.0,
+                time_diff,
+            )
+
+
 @app.post("/schemas")  # pragma: no cover
 def create_schema():  # pragma: no cover
     """
@@ -165,32 +493,15 @@ def generate_documents():  # pragma: no cover
             )
             return result
 
-        schema_fields, count = result
+        plan, count, seed, offset = result
         schema_name = data.get("schema_name")
         accept = request.headers.get("Accept", "application/json")
 
-        if accept == "application/x-ndjson":
-            lines = [json.dumps(make_document(schema_fields)) for _ in range(count)]
-            time_diff = (time.monotonic() - time_start) * 1000
-            log.info(
-                "action=docs.generate component=api outcome=success status=200 schema=%s count=%s mime=ndjson duration_ms=%.1f",
-                schema_name,
-                count,
-                time_diff,
-            )
-            return Response(
-                "\n".join(lines) + "\n", mimetype="application/x-ndjson", status=200
-            )
-        else:
-            documents = [make_document(schema_fields) for _ in range(count)]
-            time_diff = (time.monotonic() - time_start) * 1000
-            log.info(
-                "action=docs.generate component=api outcome=success status=200 schema=%s count=%s mime=json duration_ms=%.1f",
-                schema_name,
-                count,
-                time_diff,
-            )
-            return jsonify(documents), 200
+        mime = "ndjson" if accept == "application/x-ndjson" else "json"
+        body = stream_documents(
+            plan, count, seed, offset, mime, schema_name, time_start
+        )
+        return Response(body, mimetype=STREAM_FORMATS[mime][0], status=200)
 
     except Exception:
         time_diff = (time.monotonic() - time_start) * 1000
@@ -199,3 +510,17 @@ def generate_documents():  # pragma: no cover
             time_diff,
         )
         raise
+
+
+@app.get("/metrics")  # pragma: no cover
+def metrics_endpoint():  # pragma: no cover
+    """
+    Prometheus metrics for this process, or merged across every server
+    process when METRICS_DIR is set.
+    """
+    if METRICS_DIR:
+        metrics.REGISTRY.write_snapshot(METRICS_DIR)
+        text = metrics.render_snapshot(metrics.merge_snapshots(METRICS_DIR))
+    else:
+        text = metrics.REGISTRY.render()
+    return Response(text, content_type=metrics.CONTENT_TYPE)
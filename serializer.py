@@ -0,0 +1,138 @@
+import json
+from functools import partial
+from itertools import repeat
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+### both backends write compact UTF-8 JSON, so output does not depend on which is installed
+stdlib_dumps = partial(json.dumps, separators=(",", ":"), ensure_ascii=False)
+
+
+def stdlib_encode(obj, sort_keys=False, default=None):
+    return stdlib_dumps(obj, sort_keys=sort_keys, default=default).encode()
+
+
+if orjson is not None:
+    ### hand these to `default` (or fail) like json.dumps rather than orjson's own format
+    PASSTHROUGH = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS
+
+    def dumps(obj, sort_keys=False, default=None):
+        """Encode obj as compact JSON bytes, keys sorted when sort_keys is set."""
+        try:
+            return orjson.dumps(
+                obj,
+                default=default,
+                option=PASSTHROUGH | orjson.OPT_SORT_KEYS if sort_keys else PASSTHROUGH,
+            )
+        except orjson.JSONEncodeError:
+            ### ints beyond 64 bits and non-str keys: let json.dumps have a go
+            return stdlib_encode(obj, sort_keys, default)
+
+else:  # pragma: no cover
+    dumps = stdlib_encode
+
+
+def dumps_lines(objs, sort_keys=False, default=None):
+    """Encode objs as one NDJSON block of bytes, newline-terminated."""
+    lines = [dumps(obj, sort_keys, default) for obj in objs]
+    if not lines:
+        return b""
+    return b"\n".join(lines) + b"\n"
+
+
+### genpool pickles the encoder to pool workers, so the sorted variant is a partial
+dumps_sorted = partial(dumps, sort_keys=True)
+
+
+### json.dumps builds a new encoder per call when given options; these are built once
+VALUE_ENCODERS = {
+    sort_keys: json.JSONEncoder(
+        separators=(",", ":"), ensure_ascii=False, sort_keys=sort_keys
+    ).encode
+    for sort_keys in (False, True)
+}
+
+
+def encode_values(values, sort_keys=False):
+    return list(map(VALUE_ENCODERS[sort_keys], values))
+
+
+def encode_strings(values, sort_keys=False):
+    ### encode_basestring escapes exactly what dumps does for a str, in C
+    try:
+        return list(map(json.encoder.encode_basestring, values))
+    except TypeError:
+        return encode_values(values, sort_keys)
+
+
+def encode_ints(values, sort_keys=False):
+    try:
+        return list(map(int.__repr__, values))
+    except TypeError:
+        return encode_values(values, sort_keys)
+
+
+### value type a column is declared to hold -> how the whole column is encoded
+COLUMN_ENCODERS = {str: encode_strings, int: encode_ints}
+
+
+class RowTemplate:
+    """
+    Renders rows, tuples of values in a schema's field order, as JSON
+    objects; output matches dumps() of the equivalent dict, keys sorted if
+    sort_keys is set. fields: (name, value type) pairs, see
+    generators.SchemaPlan.
+
+    The "key": fragments are escaped once up front and each column is
+    encoded in one pass, so a row is a single % into the template with no
+    dict per document. orjson encodes a whole dict faster than one call per
+    value though, so when it is installed rows are zipped into dicts and
+    encoded without leaving C, and the template is the json.dumps path.
+    """
+
+    def __init__(self, fields, sort_keys=False):
+        self.names = [name for name, _ in fields]
+        order = range(len(fields))
+        if sort_keys:
+            order = sorted(order, key=lambda i: fields[i][0])
+        self.order = list(order)
+        self.sort_keys = sort_keys
+        self.encoders = [
+            COLUMN_ENCODERS.get(fields[i][1], encode_values) for i in self.order
+        ]
+        self.template = (
+            "{"
+            + ",".join(
+                stdlib_dumps(fields[i][0]).replace("%", "%%") + ":%s"
+                for i in self.order
+            )
+            + "}"
+        )
+
+    def strings(self, rows):
+        """One JSON document per row, filled into the template."""
+        if not self.order:
+            return [self.template] * len(rows)
+        columns = list(zip(*rows))
+        encoded = [
+            encode(columns[i], self.sort_keys)
+            for i, encode in zip(self.order, self.encoders)
+        ]
+        return list(map(self.template.__mod__, zip(*encoded)))
+
+    def lines(self, rows):
+        """One JSON document in bytes per row."""
+        if orjson is not None:
+            encode = (
+                partial(orjson.dumps, option=orjson.OPT_SORT_KEYS)
+                if self.sort_keys
+                else orjson.dumps
+            )
+            try:
+                return list(map(encode, map(dict, map(zip, repeat(self.names), rows))))
+            except orjson.JSONEncodeError:
+                pass
+        return list(map(str.encode, self.strings(rows)))
@@ -0,0 +1,285 @@
+import os
+import struct
+import threading
+import time
+import zlib
+from collections import deque
+from logsetup import setup_logging, get_logger
+
+setup_logging()
+log = get_logger(__name__)
+
+### payload bytes, docs, crc32 of the payload
+HEADER = struct.Struct("<III")
+OFFSET_FILE = "offset"
+FSYNC_POLICIES = ("always", "interval", "never")
+
+
+def segment_name(seq):
+    return f"{seq:020d}.seg"
+
+
+class Spool:
+    """
+    Append-only on-disk queue of bulk bodies, split into numbered segment
+    files under `path`. put() appends a record, blocking while more than
+    max_bytes are waiting to be acked; get() hands records out in order
+    and ack() commits the read offset once every earlier record is acked.
+    The offset survives restarts, so anything not acked is replayed
+    (at-least-once); a torn record at the tail is truncated on open, and
+    an offset past the surviving data is pulled back to its end.
+    fsync: "always" syncs every put, "interval" at most every
+    fsync_interval seconds, "never" leaves it to the OS.
+    """
+
+    def __init__(
+        self, path, max_bytes, segment_bytes, fsync="interval", fsync_interval=1.0
+    ):
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"fsync must be one of {FSYNC_POLICIES}, got {fsync!r}")
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.max_bytes = max_bytes
+        self.segment_bytes = segment_bytes
+        self.fsync = fsync
+        self.fsync_interval = fsync_interval
+        self.last_fsync = time.monotonic()
+        self.dirty = False
+
+        self.cond = threading.Condition()
+        self.pending = deque()
+        self.readers = {}
+        self.full = False
+
+        segments = sorted(
+            int(name[:-4]) for name in os.listdir(path) if name.endswith(".seg")
+        )
+        commit_seq, commit_pos = self.read_offset()
+        for seq in segments:
+            if seq < commit_seq:
+                os.remove(self.segment_path(seq))
+        segments = [seq for seq in segments if seq >= commit_seq] or [commit_seq]
+        if segments[0] != commit_seq:
+            commit_pos = 0
+
+        self.ends = {}
+        records = 0
+        for seq in segments:
+            start = commit_pos if seq == segments[0] else 0
+            end, count = self.scan(seq, start, last=seq == segments[-1])
+            self.ends[seq] = end
+            records += count
+        if commit_pos > self.ends[segments[0]]:
+            ### the offset outlived data that never reached the disk
+            log.warning(
+                "action=spool.open component=spool outcome=offset_clamped segment=%s offset=%s valid_bytes=%s",
+                segment_name(segments[0]),
+                commit_pos,
+                self.ends[segments[0]],
+            )
+            commit_pos = self.ends[segments[0]]
+
+        self.commit = (segments[0], commit_pos)
+        self.read = self.commit
+        self.write_seq = segments[-1]
+        self.writer = open(self.segment_path(self.write_seq), "ab")
+        self.size = sum(self.ends.values()) - commit_pos
+        self.records = records
+        log.info(
+            "action=spool.open component=spool outcome=success path=%s segments=%s replay_records=%s size_bytes=%s fsync=%s",
+            path,
+            len(segments),
+            records,
+            self.size,
+            fsync,
+        )
+
+    def segment_path(self, seq):
+        return os.path.join(self.path, segment_name(seq))
+
+    def read_offset(self):
+        try:
+            with open(os.path.join(self.path, OFFSET_FILE)) as f:
+                seq, pos = f.read().split()
+            return int(seq), int(pos)
+        except FileNotFoundError:
+            return 0, 0
+
+    def write_offset(self):
+        tmp = os.path.join(self.path, OFFSET_FILE + ".tmp")
+        with open(tmp, "w") as f:
+            f.write("%d %d\n" % self.commit)
+            if self.fsync != "never":
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(tmp, os.path.join(self.path, OFFSET_FILE))
+
+    def scan(self, seq, start, last):
+        """
+        Walk the records of a segment from `start`, returning the end of the
+        last complete record and how many there were. A torn or corrupt
+        record ends the segment; in the last segment it is truncated away.
+        """
+        path = self.segment_path(seq)
+        if not os.path.exists(path):
+            open(path, "wb").close()
+        size = os.path.getsize(path)
+        pos = min(start, size)
+        count = 0
+        with open(path, "rb") as f:
+            f.seek(pos)
+            while pos + HEADER.size <= size:
+                length, _, crc = HEADER.unpack(f.read(HEADER.size))
+                payload = f.read(length)
+                if len(payload) != length or zlib.crc32(payload) != crc:
+                    break
+                pos += HEADER.size + length
+                count += 1
+        if pos != size:
+            log.warning(
+                "action=spool.scan component=spool outcome=truncated segment=%s valid_bytes=%s file_bytes=%s",
+                segment_name(seq),
+                pos,
+                size,
+            )
+            if last:
+                os.truncate(path, pos)
+        return pos, count
+
+    def put(self, body, docs):
+        frame = HEADER.pack(len(body), docs, zlib.crc32(body)) + body
+        with self.cond:
+            while self.size and self.size + len(frame) > self.max_bytes:
+                if not self.full:
+                    self.full = True
+                    log.warning(
+                        "action=spool.full component=spool size_bytes=%s max_bytes=%s",
+                        self.size,
+                        self.max_bytes,
+                    )
+                self.cond.wait()
+            self.full = False
+
+            end = self.ends[self.write_seq]
+            if end and end + len(frame) > self.segment_bytes:
+                self.roll()
+            self.writer.write(frame)
+            self.writer.flush()
+            self.ends[self.write_seq] += len(frame)
+            self.size += len(frame)
+            self.records += 1
+
+            self.dirty = True
+            now = time.monotonic()
+            if self.fsync == "always" or (
+                self.fsync == "interval"
+                and now - self.last_fsync >= self.fsync_interval
+            ):
+                self.sync()
+            self.cond.notify_all()
+
+    def sync(self):
+        os.fsync(self.writer.fileno())
+        self.last_fsync = time.monotonic()
+        self.dirty = False
+
+    def roll(self):
+        if self.fsync != "never":
+            self.sync()
+        self.writer.close()
+        self.write_seq += 1
+        self.ends[self.write_seq] = 0
+        self.writer = open(self.segment_path(self.write_seq), "ab")
+
+    def get(self, timeout=None):
+        """
+        Return the next unread record as (token, body, docs), or None if
+        nothing arrived within timeout seconds. Pass the token to ack().
+        """
+        with self.cond:
+            while True:
+                seq, pos = self.read
+                if pos >= self.ends[seq]:
+                    if seq != self.write_seq:
+                        self.read = (min(s for s in self.ends if s > seq), 0)
+                        continue
+                    if not self.cond.wait(timeout):
+                        return None
+                    continue
+
+                fd = self.readers.get(seq)
+                if fd is None:
+                    fd = self.readers[seq] = os.open(
+                        self.segment_path(seq), os.O_RDONLY
+                    )
+                length, docs, crc = HEADER.unpack(os.pread(fd, HEADER.size, pos))
+                if pos + HEADER.size + length <= self.ends[seq]:
+                    body = os.pread(fd, length, pos + HEADER.size)
+                    if len(body) == length and zlib.crc32(body) == crc:
+                        break
+                self.drop_tail(seq, pos)
+
+            token = (seq, pos + HEADER.size + length)
+            self.read = token
+            self.records -= 1
+            self.pending.append([token, HEADER.size + length, False])
+            return token, body, docs
+
+    def drop_tail(self, seq, pos):
+        """
+        A record at pos failed its CRC check: give up on the rest of the
+        segment, as scan() does on open. Writing moves on to a new segment
+        and the dropped bytes are committed like an acked record.
+        """
+        log.error(
+            "action=spool.get component=spool outcome=corrupt segment=%s pos=%s dropped_bytes=%s",
+            segment_name(seq),
+            pos,
+            self.ends[seq] - pos,
+        )
+        if seq == self.write_seq:
+            self.roll()
+        self.pending.append([(seq, self.ends[seq]), self.ends[seq] - pos, True])
+        self.ends[seq] = pos
+        ### the records lost with the tail cannot be counted; drop the one read
+        self.records = max(self.records - 1, 0)
+        self.commit_acked()
+
+    def ack(self, token):
+        with self.cond:
+            for entry in self.pending:
+                if entry[0] == token:
+                    entry[2] = True
+                    break
+            self.commit_acked()
+
+    def commit_acked(self):
+        ### called with the lock held
+        committed = None
+        while self.pending and self.pending[0][2]:
+            committed, length, _ = self.pending.popleft()
+            self.size -= length
+        if committed is None:
+            return
+
+        self.commit = committed
+        ### the offset must never be durable ahead of the data it points past
+        if self.dirty and self.fsync != "never":
+            self.sync()
+        self.write_offset()
+        for seq in [seq for seq in self.ends if seq < committed[0]]:
+            fd = self.readers.pop(seq, None)
+            if fd is not None:
+                os.close(fd)
+            os.remove(self.segment_path(seq))
+            del self.ends[seq]
+        self.cond.notify_all()
+
+    def close(self):
+        with self.cond:
+            if self.fsync != "never":
+                os.fsync(self.writer.fileno())
+            self.writer.close()
+            for fd in self.readers.values():
+                os.close(fd)
+            self.readers.clear()
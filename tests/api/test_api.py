@@ -156,3 +156,21 @@ def test_generate_documents_multiple(api_request_context: APIRequestContext):
         assert "dob" in doc
         assert "ip" in doc
         assert "country_code" in doc
+
+
+def test_generate_documents_seeded(api_request_context: APIRequestContext):
+    document = {"schema_name": "Haroldas's Generator", "count": 10, "seed": 1234}
+    response = api_request_context.post("/generate-documents", data=document)
+    assert response.ok, f"Failed to generate documents: {response.status}"
+    full = response.json()
+
+    document = {
+        "schema_name": "Haroldas's Generator",
+        "count": 5,
+        "seed": 1234,
+        "offset": 5,
+    }
+    response = api_request_context.post("/generate-documents", data=document)
+    assert response.ok, f"Failed to generate documents: {response.status}"
+
+    assert response.json() == full[5:], "Seeded window does not match full run"
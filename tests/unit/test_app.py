@@ -0,0 +1,203 @@
+import sys
+import os
+import json
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "../../")))
+
+
+class MemoryDB:
+    """
+    Stands in for db.DB: schemas live in a dict of name -> (fields, version)
+    and every query is recorded.
+    """
+
+    def __init__(self):
+        self.schemas = {}
+        self.queries = []
+        self.hooks = []
+
+    def init_schema(self):
+        pass
+
+    def query_one(self, sql, params=None):
+        self.queries.append(sql)
+        schema = self.schemas.get(params[0])
+        if schema is None:
+            return None
+        fields, version = schema
+        return {"id": 1, "fields": json.dumps(fields), "updated_at": version}
+
+
+### miniproject2 connects to MySQL at import; give it the in-memory DB instead
+import db
+
+db.DB = MemoryDB
+
+import miniproject2
+from miniproject2 import SchemaCache
+import serializer
+from flask import jsonify
+from generators import compile_schema, iter_documents
+import pytest
+
+FIELDS = {"id": {"type": "integer"}, "game": {"type": "game"}}
+
+
+@pytest.fixture
+def memory_db(monkeypatch):
+    memory = MemoryDB()
+    memory.schemas["Esports"] = (FIELDS, 1)
+    monkeypatch.setattr(miniproject2, "db", memory)
+    return memory
+
+
+def use_cache(monkeypatch, ttl=300, check_interval=60):
+    cache = SchemaCache(4, ttl, check_interval)
+    monkeypatch.setattr(miniproject2, "schema_cache", cache)
+    return cache
+
+
+def field_loads(memory):
+    return sum("`fields`" in sql for sql in memory.queries)
+
+
+def test_schema_cache_evicts_least_recently_used():
+    cache = SchemaCache(2, 300, 2)
+    cache.put("a", ("plan a",))
+    cache.put("b", ("plan b",))
+    cache.get("a")
+    cache.put("c", ("plan c",))
+
+    assert list(cache.entries) == ["a", "c"]
+    assert cache.get("b") is None
+
+
+def test_schema_cache_touch_only_updates_the_same_entry():
+    cache = SchemaCache(2, 300, 2)
+    entry = ("plan", "v1", 10.0, 10.0)
+    cache.put("a", entry)
+
+    cache.touch("a", entry, 20.0)
+    assert cache.get("a") == ("plan", "v1", 10.0, 20.0)
+
+    cache.touch("a", entry, 30.0)
+    assert cache.get("a") == ("plan", "v1", 10.0, 20.0)
+
+
+def test_schema_cache_discard():
+    cache = SchemaCache(2, 300, 2)
+    cache.put("a", ("plan",))
+    cache.discard("a")
+    cache.discard("missing")
+
+    assert cache.get("a") is None
+
+
+def test_load_schema_plan_serves_hits_from_cache(monkeypatch, memory_db):
+    use_cache(monkeypatch)
+
+    first = miniproject2.load_schema_plan("Esports")
+    second = miniproject2.load_schema_plan("Esports")
+
+    assert first is second
+    assert first.names == ["game", "id"]
+    assert field_loads(memory_db) == 1
+
+
+def test_load_schema_plan_reloads_expired_entries(monkeypatch, memory_db):
+    use_cache(monkeypatch, ttl=0)
+
+    first = miniproject2.load_schema_plan("Esports")
+    second = miniproject2.load_schema_plan("Esports")
+
+    assert first is not second
+    assert field_loads(memory_db) == 2
+
+
+def test_load_schema_plan_checks_versions(monkeypatch, memory_db):
+    use_cache(monkeypatch, check_interval=0)
+
+    first = miniproject2.load_schema_plan("Esports")
+    assert miniproject2.load_schema_plan("Esports") is first
+    assert field_loads(memory_db) == 1
+
+    memory_db.schemas["Esports"] = ({"id": {"type": "integer"}}, 2)
+    stale = miniproject2.load_schema_plan("Esports")
+
+    assert stale is not first
+    assert stale.names == ["id"]
+    assert field_loads(memory_db) == 2
+
+
+def test_load_schema_plan_drops_deleted_schemas(monkeypatch, memory_db):
+    cache = use_cache(monkeypatch, check_interval=0)
+    miniproject2.load_schema_plan("Esports")
+
+    del memory_db.schemas["Esports"]
+
+    assert miniproject2.load_schema_plan("Esports") is None
+    assert cache.get("Esports") is None
+
+
+def generate(accept, count, seed=None):
+    client = miniproject2.app.test_client()
+    body = {"schema_name": "Esports", "count": count}
+    if seed is not None:
+        body["seed"] = seed
+    return client.post(
+        "/generate-documents", json=body, headers={"Accept": accept}, buffered=False
+    )
+
+
+def seeded_documents(count, seed):
+    return [
+        document
+        for documents in iter_documents(compile_schema(FIELDS), count, seed)
+        for document in documents
+    ]
+
+
+@pytest.mark.parametrize("count", [1, 3, 10])
+def test_generate_documents_joins_json_batches(monkeypatch, memory_db, count):
+    use_cache(monkeypatch)
+    monkeypatch.setattr(miniproject2, "STREAM_BATCH_SIZE", 3)
+
+    response = generate("application/json", count)
+    chunks = list(response.iter_encoded())
+    documents = json.loads(b"".join(chunks))
+
+    assert response.status_code == 200
+    assert response.mimetype == "application/json"
+    ### one chunk per batch of 3, then the closing bracket
+    assert len(chunks) == -(-count // 3) + 1
+    assert chunks[0].startswith(b"[{") and chunks[-1] == b"]\n"
+    assert all(chunk.startswith(b",{") for chunk in chunks[1:-1])
+    assert len(documents) == count
+    assert all(list(document) == ["game", "id"] for document in documents)
+
+
+def test_generate_documents_seeded_json_matches_jsonify(monkeypatch, memory_db):
+    use_cache(monkeypatch)
+
+    response = generate("application/json", 10, seed=5)
+    with miniproject2.app.app_context():
+        expected = jsonify(seeded_documents(10, 5)).get_data()
+
+    assert b"".join(response.iter_encoded()) == expected
+
+
+@pytest.mark.parametrize("count", [1, 10])
+def test_generate_documents_streams_ndjson(monkeypatch, memory_db, count):
+    use_cache(monkeypatch)
+    monkeypatch.setattr(miniproject2, "STREAM_BATCH_SIZE", 3)
+
+    unseeded = b"".join(generate("application/x-ndjson", count).iter_encoded())
+    response = generate("application/x-ndjson", count, seed=5)
+    body = b"".join(response.iter_encoded())
+
+    assert response.status_code == 200
+    assert response.mimetype == "application/x-ndjson"
+    assert unseeded.endswith(b"}\n") and len(unseeded.splitlines()) == count
+    assert body == b"\n".join(
+        serializer.dumps(document) for document in seeded_documents(count, 5)
+    ) + b"\n"
@@ -0,0 +1,366 @@
+import sys
+import os
+import json
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "../../")))
+
+### data_shipper builds its clients at import; nothing here connects to them
+os.environ.setdefault("API_URL", "http://127.0.0.1:9")
+os.environ.setdefault("ES_URL", "http://127.0.0.1:9")
+os.environ.setdefault("ES_PASS", "")
+
+import data_shipper
+from data_shipper import BulkSizer
+from spool import Spool
+import elastic_transport
+import pytest
+
+
+def test_bulk_sizer_grows_fast_bulks():
+    sizer = BulkSizer(100, 10, 1000, 1000)
+
+    assert sizer.record(100) == 126
+    assert sizer.record(100) == 158
+
+
+def test_bulk_sizer_holds_bulks_near_target():
+    sizer = BulkSizer(100, 10, 1000, 1000)
+
+    assert sizer.record(500) == 100
+    assert sizer.record(1000) == 100
+
+
+def test_bulk_sizer_shrinks_slow_bulks():
+    sizer = BulkSizer(100, 10, 1000, 1000)
+
+    assert sizer.record(1001) == 80
+
+
+def test_bulk_sizer_halves_on_rejections():
+    sizer = BulkSizer(100, 10, 1000, 1000)
+
+    assert sizer.record(10, rejected=3) == 50
+
+
+def test_bulk_sizer_stays_within_bounds():
+    sizer = BulkSizer(5000, 10, 1000, 1000)
+    assert sizer.size == 1000
+    assert sizer.record(1) == 1000
+
+    for _ in range(10):
+        sizer.record(10, rejected=1)
+    assert sizer.size == 10
+
+
+@pytest.mark.parametrize(
+    "refresh, disabled, expected",
+    [
+        ("wait_for", False, "wait_for"),
+        ("wait_for", True, None),
+        ("none", False, None),
+        ("interval", False, None),
+    ],
+)
+def test_bulk_refresh_skips_wait_for_when_refresh_is_disabled(
+    monkeypatch, refresh, disabled, expected
+):
+    monkeypatch.setattr(data_shipper, "BULK_REFRESH", refresh)
+    monkeypatch.setattr(data_shipper, "BULK_DISABLE_REFRESH", disabled)
+
+    assert data_shipper.bulk_refresh() == expected
+
+
+def test_load_schema_fields_normalises_schema_file(monkeypatch, tmp_path):
+    schema_file = tmp_path / "schema.json"
+    schema_file.write_text(
+        '{"schema_name": "Esports", "fields": {"id": "integer", "game": {"type": "game"}}}'
+    )
+    monkeypatch.setattr(data_shipper, "SHIPPER_SOURCE", "file")
+    monkeypatch.setattr(data_shipper, "SCHEMA_FILE", str(schema_file))
+
+    fields = data_shipper.load_schema_fields()
+
+    assert fields == {"id": {"type": "integer"}, "game": {"type": "game"}}
+    assert data_shipper.compile_schema(fields).names == ["game", "id"]
+
+
+def test_load_schema_fields_rejects_unknown_types(monkeypatch, tmp_path):
+    schema_file = tmp_path / "schema.json"
+    schema_file.write_text('{"fields": {"id": "integer", "mood": "emoji"}}')
+    monkeypatch.setattr(data_shipper, "SHIPPER_SOURCE", "file")
+    monkeypatch.setattr(data_shipper, "SCHEMA_FILE", str(schema_file))
+
+    with pytest.raises(ValueError) as error:
+        data_shipper.load_schema_fields()
+    assert "['emoji']" in str(error.value)
+
+
+class FakeES:
+    """
+    Stands in for data_shipper.ES: each bulk call takes the next entry of
+    `responses`, a status per document in request order or an exception.
+    """
+
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.bodies = []
+
+    def options(self, **kwargs):
+        return self
+
+    def bulk(self, operations, refresh=None):
+        self.bodies.append(operations)
+        response = self.responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        items = [
+            {"index": {"status": status, "error": {"type": f"status_{status}"}}}
+            if status >= 300
+            else {"index": {"status": status}}
+            for status in response
+        ]
+        return {"errors": any(status >= 300 for status in response), "items": items}
+
+
+@pytest.fixture
+def fake_es(monkeypatch, tmp_path):
+    def install(*responses):
+        es = FakeES(*responses)
+        monkeypatch.setattr(data_shipper, "ES", es)
+        return es
+
+    monkeypatch.setattr(data_shipper, "SIZER", BulkSizer(100, 10, 1000, 1000))
+    monkeypatch.setattr(data_shipper, "BULK_REFRESH", "none")
+    monkeypatch.setattr(data_shipper, "BULK_RETRIES", 2)
+    monkeypatch.setattr(data_shipper, "backoff", lambda attempt: 0)
+    monkeypatch.setattr(
+        data_shipper, "DEAD_LETTER_FILE", str(tmp_path / "dead_letter.ndjson")
+    )
+    return install
+
+
+def documents(*names):
+    return [b'{"n": "%s"}' % name.encode() for name in names]
+
+
+def dead_letters():
+    if not os.path.exists(data_shipper.DEAD_LETTER_FILE):
+        return []
+    with open(data_shipper.DEAD_LETTER_FILE) as f:
+        return [json.loads(line) for line in f]
+
+
+def chunk_docs(chunks):
+    return [docs for _, docs in chunks]
+
+
+def test_iter_bulk_chunks_cuts_at_the_doc_limit():
+    lines = documents("a", "b", "c", "d", "e")
+
+    chunks = list(data_shipper.iter_bulk_chunks(lines, max_docs=2))
+
+    assert chunk_docs(chunks) == [2, 2, 1]
+    assert [body for body, _ in chunks] == [
+        data_shipper.bulk_body(lines[0:2]),
+        data_shipper.bulk_body(lines[2:4]),
+        data_shipper.bulk_body(lines[4:]),
+    ]
+
+
+def test_iter_bulk_chunks_cuts_at_the_byte_limit():
+    lines = documents("a", "b", "c", "d", "e")
+    ### exactly two documents fit: the byte accounting matches the built body
+    max_bytes = len(data_shipper.bulk_body(lines[:2]))
+
+    chunks = list(data_shipper.iter_bulk_chunks(lines, 100, max_bytes))
+
+    assert chunk_docs(chunks) == [2, 2, 1]
+    assert all(len(body) <= max_bytes for body, _ in chunks)
+
+
+def test_iter_bulk_chunks_sends_an_oversized_document_alone():
+    lines = documents("a", "b" * 500, "c")
+
+    chunks = list(data_shipper.iter_bulk_chunks(lines, 100, 100))
+
+    assert chunk_docs(chunks) == [1, 1, 1]
+    assert chunks[1][0] == data_shipper.bulk_body([lines[1]])
+
+
+def test_iter_bulk_chunks_follows_the_live_sizer(monkeypatch):
+    sizer = BulkSizer(2, 1, 10, 1000)
+    monkeypatch.setattr(data_shipper, "SIZER", sizer)
+    chunks = data_shipper.iter_bulk_chunks(documents(*"abcdefgh"))
+
+    assert next(chunks)[1] == 2
+    sizer.size = 4
+    assert chunk_docs(chunks) == [4, 2]
+
+
+class FakeStream:
+    def __init__(self, lines):
+        self.lines = lines
+        self.status_code = 200
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def raise_for_status(self):
+        pass
+
+    def iter_lines(self, chunk_size=None):
+        return iter(self.lines)
+
+
+def test_fetch_doc_lines_skips_blank_lines(monkeypatch):
+    lines = [b'{"n": 1}', b"", b'{"n": 2}', b"  ", b'{"n": 3}']
+
+    class Session:
+        def post(self, *args, **kwargs):
+            return FakeStream(lines)
+
+    monkeypatch.setattr(data_shipper, "SESSION", Session())
+
+    assert list(data_shipper.fetch_doc_lines()) == [lines[0], lines[2], lines[4]]
+
+
+
+def test_fetch_doc_lines_times_only_the_stream(monkeypatch):
+    lines = [b'{"n": 1}', b'{"n": 2}', b'{"n": 3}']
+    observed = []
+
+    class Session:
+        def post(self, *args, **kwargs):
+            return FakeStream(lines)
+
+    class Histogram:
+        def observe(self, value, **labels):
+            observed.append((value, labels))
+
+    monkeypatch.setattr(data_shipper, "SESSION", Session())
+    monkeypatch.setattr(data_shipper, "PHASE_SECONDS", Histogram())
+
+    for _ in data_shipper.fetch_doc_lines():
+        ### the consumer holding a line (sending a bulk) is not fetch time
+        assert data_shipper.IN_FLIGHT.collect()[("docs.fetch",)] == 0
+        time.sleep(0.05)
+
+    [(seconds, labels)] = observed
+    assert labels == {"phase": "docs.fetch"}
+    assert seconds < 0.05
+    assert not data_shipper.SourceTimer.active
+
+
+def test_item_results_pairs_status_and_error_per_document():
+    res = {
+        "errors": True,
+        "items": [
+            {"index": {"status": 201}},
+            {"create": {"status": 429, "error": {"type": "rejected"}}},
+            {"index": {}},
+        ],
+    }
+
+    assert data_shipper.item_results(res) == [
+        (201, None),
+        (429, {"type": "rejected"}),
+        (0, None),
+    ]
+
+
+def test_backoff_is_capped_full_jitter(monkeypatch):
+    monkeypatch.setattr(data_shipper, "BULK_BACKOFF_MS", 100)
+    monkeypatch.setattr(data_shipper, "BULK_BACKOFF_MAX_MS", 1000)
+
+    for attempt, cap in [(1, 0.1), (2, 0.2), (4, 0.8), (10, 1.0)]:
+        delays = [data_shipper.backoff(attempt) for _ in range(200)]
+        assert all(0 <= delay <= cap for delay in delays)
+        assert max(delays) > cap / 2
+
+
+def test_send_bulk_retries_rejected_items_and_dead_letters_the_rest(fake_es):
+    es = fake_es([201, 429, 400, 429], [201, 201])
+    lines = documents("a", "b", "c", "d")
+
+    indexed = data_shipper.send_bulk(data_shipper.bulk_body(lines), len(lines))
+
+    assert indexed == 3
+    assert es.bodies[1] == data_shipper.bulk_body([lines[1], lines[3]])
+    assert [(r["source"], r["status"], r["attempts"]) for r in dead_letters()] == [
+        (lines[2].decode(), 400, 1)
+    ]
+
+
+def test_send_bulk_dead_letters_items_that_run_out_of_retries(fake_es):
+    fake_es([201, 503], [503], [503])
+    lines = documents("a", "b")
+
+    indexed = data_shipper.send_bulk(data_shipper.bulk_body(lines), len(lines))
+
+    assert indexed == 1
+    assert [(r["source"], r["status"], r["attempts"]) for r in dead_letters()] == [
+        (lines[1].decode(), 503, 3)
+    ]
+
+
+def test_send_bulk_retries_requests_that_never_reached_es(fake_es):
+    es = fake_es(elastic_transport.ConnectionError("refused"), [201, 201])
+    lines = documents("a", "b")
+
+    indexed = data_shipper.send_bulk(data_shipper.bulk_body(lines), len(lines))
+
+    assert indexed == 2
+    assert len(es.bodies) == 2
+    assert dead_letters() == []
+
+
+def test_send_bulk_does_not_resend_timed_out_requests(fake_es):
+    es = fake_es(elastic_transport.ConnectionTimeout("read timed out"))
+    lines = documents("a", "b")
+
+    indexed = data_shipper.send_bulk(data_shipper.bulk_body(lines), len(lines))
+
+    assert indexed == 0
+    assert len(es.bodies) == 1
+    assert [r["status"] for r in dead_letters()] == [
+        data_shipper.TIMEOUT_STATUS
+    ] * 2
+
+
+def test_send_bulk_hold_raises_exhausted_retries_back(fake_es):
+    fake_es([201, 429, 400], [429], [429])
+    lines = documents("a", "b", "c")
+
+    with pytest.raises(data_shipper.BulkDeferred) as deferred:
+        data_shipper.send_bulk(data_shipper.bulk_body(lines), len(lines), hold=True)
+
+    assert deferred.value.indexed == 1
+    assert deferred.value.docs == 1
+    assert deferred.value.body == data_shipper.bulk_body([lines[1]])
+    assert [r["status"] for r in dead_letters()] == [400]
+
+
+def test_ship_spooled_leaves_failed_records_unacked(monkeypatch, tmp_path):
+    spool = Spool(str(tmp_path), 1 << 20, 1 << 20, fsync="never")
+    monkeypatch.setattr(data_shipper, "spool", spool)
+    outcomes = [OSError("No space left on device"), 2]
+
+    def send_spooled(body, docs):
+        outcome = outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    monkeypatch.setattr(data_shipper, "send_spooled", send_spooled)
+    spool.put(b"body", 2)
+    record = spool.get(timeout=0)
+
+    assert data_shipper.ship_spooled(record) is None
+    assert spool.size > 0
+    assert data_shipper.ship_spooled(record) == 2
+    assert spool.size == 0
+    spool.close()
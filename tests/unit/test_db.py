@@ -0,0 +1,79 @@
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "../../")))
+
+from db import ConnectionPool
+import pytest
+
+
+class FakeConnection:
+    def __init__(self):
+        self.open = True
+        self.pings = 0
+
+    def ping(self, reconnect=True):
+        self.pings += 1
+
+    def close(self):
+        self.open = False
+
+
+def make_pool(**overrides):
+    settings = {
+        "min_size": 1,
+        "max_size": 2,
+        "timeout": 0.05,
+        "max_lifetime": 60,
+        "ping_interval": 60,
+    }
+    settings.update(overrides)
+    return ConnectionPool(FakeConnection, **settings)
+
+
+def test_pool_reuses_idle_connection():
+    pool = make_pool()
+    with pool.connection() as (first, _):
+        pass
+    with pool.connection() as (second, _):
+        pass
+
+    assert first is second
+    assert pool.size == 1
+    assert pool.in_use == 0
+
+
+def test_pool_times_out_when_exhausted():
+    pool = make_pool(max_size=1)
+    with pool.connection():
+        with pytest.raises(RuntimeError) as error:
+            pool.acquire()
+
+    assert "Timed out" in str(error.value)
+    assert pool.in_use == 0
+
+
+def test_pool_discards_broken_connection():
+    pool = make_pool()
+    with pool.connection() as (first, _):
+        first.open = False
+    with pool.connection() as (second, _):
+        pass
+
+    assert first is not second
+    assert pool.size == 1
+
+
+def test_pool_recycles_old_connection_and_pings_idle_one():
+    pool = make_pool(max_lifetime=0)
+    with pool.connection() as (first, _):
+        pass
+    with pool.connection() as (second, _):
+        pass
+    assert first is not second
+    assert not first.open
+
+    pool = make_pool(ping_interval=0)
+    with pool.connection() as (conn, _):
+        pass
+    assert conn.pings == 1
@@ -0,0 +1,125 @@
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "../../")))
+
+import json
+from concurrent.futures.process import BrokenProcessPool
+
+import genpool
+import pytest
+from generators import compile_schema, iter_documents
+
+
+def test_chunk_windows_align_to_seed_chunks():
+    windows = list(genpool.chunk_windows(count=4500, offset=700, chunk_size=2000))
+
+    assert windows == [(700, 1300), (2000, 2000), (4000, 1200)]
+
+
+def test_pool_output_matches_in_process():
+    plan = compile_schema(
+        {
+            "id": {"type": "integer"},
+            "game": {"type": "game"},
+            "org": {"type": "org"},
+        }
+    )
+    arguments = (plan, 2500, "seed", 300, json.dumps, 500)
+
+    local = [
+        line for lines in genpool.iter_encoded(*arguments, workers=0) for line in lines
+    ]
+    try:
+        pooled = [
+            line
+            for lines in genpool.iter_encoded(
+                *arguments, workers=2, threshold=1, chunk_size=1000
+            )
+            for line in lines
+        ]
+    finally:
+        genpool.shutdown()
+
+    assert len(local) == 2500
+    assert pooled == local
+
+
+def test_pool_renders_row_templates_like_in_process():
+    plan = compile_schema({"id": {"type": "integer"}, "game": {"type": "game"}})
+    arguments = (plan, 2000, "seed", 0, plan.template(), 500)
+
+    local = [
+        line for lines in genpool.iter_encoded(*arguments, workers=0) for line in lines
+    ]
+    try:
+        pooled = [
+            line
+            for lines in genpool.iter_encoded(
+                *arguments, workers=2, threshold=1, chunk_size=1000
+            )
+            for line in lines
+        ]
+    finally:
+        genpool.shutdown()
+
+    assert pooled == local
+    assert [json.loads(line) for line in local] == [
+        document
+        for documents in iter_documents(plan, 2000, "seed")
+        for document in documents
+    ]
+
+
+def test_broken_pool_is_replaced_for_the_next_request():
+    plan = compile_schema({"id": {"type": "integer"}})
+    arguments = (plan, 2000, "seed", 0, json.dumps, 500)
+    try:
+        pool = genpool.get_executor(2)
+        list(genpool.iter_encoded(*arguments, workers=2, threshold=1, chunk_size=1000))
+        worker = next(iter(pool._processes.values()))
+        worker.kill()
+        worker.join()
+
+        with pytest.raises(BrokenProcessPool):
+            list(
+                genpool.iter_encoded(
+                    *arguments, workers=2, threshold=1, chunk_size=1000
+                )
+            )
+        assert genpool.executor is None
+
+        pooled = [
+            line
+            for lines in genpool.iter_encoded(
+                *arguments, workers=2, threshold=1, chunk_size=1000
+            )
+            for line in lines
+        ]
+    finally:
+        genpool.shutdown()
+
+    assert genpool.executor is None
+    assert len(pooled) == 2000
+
+
+def test_pool_gamertags_match_in_process():
+    ### workers rebuild the gamertag tables; seeded output needs them identical
+    plan = compile_schema({"nick": {"type": "name", "format": "gamertag"}})
+    arguments = (plan, 2000, 5, 0, plan.template(), 500)
+
+    local = [
+        line for lines in genpool.iter_encoded(*arguments, workers=0) for line in lines
+    ]
+    try:
+        pooled = [
+            line
+            for lines in genpool.iter_encoded(
+                *arguments, workers=2, threshold=1, chunk_size=1000
+            )
+            for line in lines
+        ]
+    finally:
+        genpool.shutdown()
+
+    assert pooled == local
@@ -0,0 +1,88 @@
+import sys
+import os
+import json
+import logging
+import queue
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "../../")))
+
+from logsetup import (
+    DropQueueHandler,
+    JsonFormatter,
+    SamplingFilter,
+    parse_sample_rates,
+    record_fields,
+)
+
+
+def make_record(msg, level=logging.INFO, args=None):
+    return logging.LogRecord("test", level, __file__, 0, msg, args, None)
+
+
+def test_parse_sample_rates():
+    assert parse_sample_rates("") == {}
+    assert parse_sample_rates("db.query_one=0.01, db.execute=1") == {
+        "db.query_one": 0.01,
+        "db.execute": 1.0,
+    }
+
+
+def test_sampling_filter_keeps_errors_and_unsampled_actions():
+    sampler = SamplingFilter({"db.query_one": 0.0})
+    assert not sampler.filter(make_record("action=db.query_one outcome=success"))
+    assert sampler.filter(
+        make_record("action=db.query_one outcome=error", logging.ERROR)
+    )
+    assert sampler.filter(make_record("action=db.execute outcome=success"))
+    assert sampler.filter(make_record("no action here"))
+
+
+def test_sampling_filter_keeps_roughly_the_rate():
+    sampler = SamplingFilter({"db.query_one": 0.25})
+    sampler.random.seed(1)
+    kept = sum(
+        sampler.filter(make_record("action=db.query_one outcome=success"))
+        for _ in range(4000)
+    )
+    assert 800 < kept < 1200
+
+
+def test_drop_queue_handler_counts_and_reports_drops():
+    handler = DropQueueHandler(queue.Queue(2))
+    for i in range(5):
+        handler.handle(make_record("action=test n=%s", args=(i,)))
+    assert handler.dropped == 3
+
+    assert handler.queue.get_nowait().getMessage() == "action=test n=0"
+    assert handler.queue.get_nowait().getMessage() == "action=test n=1"
+    handler.handle(make_record("action=test n=%s", args=(5,)))
+
+    report = handler.queue.get_nowait()
+    assert report.levelno == logging.WARNING
+    assert "dropped=3" in report.getMessage()
+    assert handler.queue.get_nowait().getMessage() == "action=test n=5"
+
+
+def test_record_fields_keeps_types_and_rounding():
+    record = make_record(
+        "action=db.query_one component=db found=%s rows=%d schema=%s duration_ms=%.1f",
+        args=(True, 3, "Esports", 1.26),
+    )
+    assert record_fields(record) == {
+        "action": "db.query_one",
+        "component": "db",
+        "found": True,
+        "rows": 3,
+        "schema": "Esports",
+        "duration_ms": 1.3,
+    }
+    assert record_fields(make_record("action=test n=%s", args=(1, 2))) is None
+
+
+def test_json_formatter_uses_record_created():
+    record = make_record("action=test component=unit count=%s", args=(2,))
+    record.created = 1700000000.25
+    doc = json.loads(JsonFormatter().format(record))
+    assert doc["@timestamp"] == "2023-11-14T22:13:20.250000+00:00"
+    assert doc["message"] == "action=test component=unit count=2"
+    assert doc["app"] == {"action": "test", "component": "unit", "count": 2}
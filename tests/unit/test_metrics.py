@@ -0,0 +1,101 @@
+import sys
+import os
+import json
+import subprocess
+import threading
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "../../")))
+
+from metrics import Registry, merge_snapshots, render_snapshot
+import pytest
+
+
+def test_counter_merges_thread_shards():
+    registry = Registry()
+    docs = registry.counter("docs_total", "Docs.", ["outcome"])
+
+    def work():
+        for _ in range(1000):
+            docs.inc(outcome="indexed")
+
+    threads = [threading.Thread(target=work) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    docs.inc(5, outcome="failed")
+
+    assert docs.collect() == {("indexed",): 4000, ("failed",): 5}
+
+
+def test_histogram_renders_cumulative_buckets():
+    registry = Registry()
+    latency = registry.histogram("latency_seconds", "Latency.", buckets=(0.1, 1))
+    for value in (0.05, 0.5, 0.5, 2):
+        latency.observe(value)
+
+    text = registry.render()
+    assert "# TYPE latency_seconds histogram" in text
+    assert 'latency_seconds_bucket{le="0.1"} 1' in text
+    assert 'latency_seconds_bucket{le="1"} 3' in text
+    assert 'latency_seconds_bucket{le="+Inf"} 4' in text
+    assert "latency_seconds_sum 3.05" in text
+    assert "latency_seconds_count 4" in text
+
+
+def test_histogram_quantile_interpolates_within_bucket():
+    registry = Registry()
+    latency = registry.histogram("latency_seconds", "Latency.", buckets=(1, 2))
+    assert latency.quantile(0.5) is None
+    for value in (1.5, 1.5, 1.5, 1.5):
+        latency.observe(value)
+    assert latency.quantile(0.5) == pytest.approx(1.5)
+
+
+def test_gauge_functions_and_label_escaping():
+    registry = Registry()
+    depth = registry.gauge("depth", "Depth.", ["queue"])
+    depth.set_function(lambda: 7, queue='a"b')
+    depth.inc(queue="plain")
+    depth.dec(queue="plain")
+
+    text = registry.render()
+    assert 'depth{queue="a\\"b"} 7' in text
+    assert 'depth{queue="plain"} 0' in text
+
+
+def test_registry_rejects_duplicate_names():
+    registry = Registry()
+    registry.counter("docs_total", "Docs.")
+    with pytest.raises(ValueError):
+        registry.counter("docs_total", "Docs.")
+
+
+def test_merge_snapshots_sums_processes_and_drops_dead_gauges(tmp_path):
+    dead = subprocess.Popen(["true"])
+    dead.wait()
+
+    for pid, docs, in_flight in ((os.getpid(), 3, 1), (dead.pid, 4, 5)):
+        registry = Registry()
+        registry.counter("docs_total", "Docs.").inc(docs)
+        registry.gauge("in_flight", "In flight.").set(in_flight)
+        registry.histogram("latency_seconds", "Latency.", buckets=(1,)).observe(0.5)
+        (tmp_path / f"{pid}.json").write_text(json.dumps(registry.snapshot()))
+
+    text = render_snapshot(merge_snapshots(str(tmp_path)))
+    assert "docs_total 7" in text
+    assert "in_flight 1" in text
+    assert 'latency_seconds_bucket{le="1"} 2' in text
+    assert "latency_seconds_count 2" in text
+
+
+def test_write_snapshot_replaces_own_file(tmp_path):
+    registry = Registry()
+    docs = registry.counter("docs_total", "Docs.")
+    docs.inc()
+    registry.write_snapshot(str(tmp_path))
+    docs.inc()
+    registry.write_snapshot(str(tmp_path))
+
+    assert [p.name for p in tmp_path.iterdir()] == [f"{os.getpid()}.json"]
+    assert "docs_total 2" in render_snapshot(merge_snapshots(str(tmp_path)))
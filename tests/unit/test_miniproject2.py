@@ -10,7 +10,15 @@ from generators import (
     generate_ip,
     generate_country,
     make_document,
+    make_documents,
+    iter_documents,
+    iter_rows,
     process_fields,
+    compile_schema,
+    GAMES,
+    PLACEMENTS,
+    GAMERTAG_WORDS,
+    format_ipv6,
 )
 from datetime import datetime, date
 import ipaddress
@@ -231,3 +239,157 @@ def test_process_fields_invalid_type():
 
     assert "bad_type" not in field_map
     assert "bad_type" in bad_types
+
+
+def test_compile_schema_game_first():
+    schema = {
+        "id": {"type": "integer", "min": 1, "max": 3},
+        "role": {"type": "role"},
+        "game": {"type": "game", "option": "cs2"},
+    }
+    plan = compile_schema(schema)
+
+    assert [field_name for field_name, _ in plan] == ["game", "id", "role"]
+
+    document = make_document(plan)
+    assert document["game"] == "cs2"
+    assert document["role"] in GAMES["cs2"]["roles"]
+
+
+def test_compile_schema_role_without_game():
+    with pytest.raises(ValueError) as error:
+        compile_schema({"role": {"type": "role"}})
+    assert str(error.value) == "role requires 'game' to be generated first"
+
+
+def test_compile_schema_rejects_bad_parameters():
+    with pytest.raises(ValueError) as error:
+        compile_schema({"name": {"type": "name", "format": "nope"}})
+    assert str(error.value) == "invalid name format entered"
+
+
+def test_make_documents_columns_follow_game():
+    schema = {
+        "id": {"type": "integer", "min": 5, "max": 6},
+        "game": {"type": "game"},
+        "role": {"type": "role"},
+        "org": {"type": "org"},
+        "trophies": {"type": "trophies", "min": 0, "max": 2},
+    }
+    documents = make_documents(schema, 200)
+
+    assert len(documents) == 200
+    for document in documents:
+        assert list(document) == ["game", "id", "role", "org", "trophies"]
+        assert 5 <= document["id"] <= 6
+        assert document["role"] in GAMES[document["game"]]["roles"]
+        assert document["org"] in GAMES[document["game"]]["orgs"]
+        assert 0 <= len(document["trophies"]) <= 2
+
+
+def test_iter_documents_seeded_offset_matches_full_run():
+    schema = {
+        "name": {"type": "name", "format": "gamertag"},
+        "id": {"type": "integer"},
+        "game": {"type": "game"},
+        "trophies": {"type": "trophies", "max": 3},
+    }
+    full = [doc for batch in iter_documents(schema, 1500, seed=42) for doc in batch]
+    window = [
+        doc
+        for batch in iter_documents(schema, 700, seed=42, offset=600)
+        for doc in batch
+    ]
+    other = [doc for batch in iter_documents(schema, 10, seed=43) for doc in batch]
+
+    assert len(full) == 1500
+    assert window == full[600:1300]
+    assert other != full[:10]
+
+
+def test_iter_rows_match_documents_in_plan_order():
+    schema = {
+        "id": {"type": "integer"},
+        "game": {"type": "game"},
+        "org": {"type": "org"},
+    }
+    plan = compile_schema(schema)
+    rows = [row for batch in iter_rows(plan, 1200, seed=7, offset=300) for row in batch]
+    documents = [
+        doc for batch in iter_documents(plan, 1200, seed=7, offset=300) for doc in batch
+    ]
+
+    assert plan.names == ["game", "id", "org"]
+    assert [dict(zip(plan.names, row)) for row in rows] == documents
+
+
+def test_compile_schema_rejects_unknown_country():
+    schema = {"country": {"type": "country", "countries": ["GB", "XX"]}}
+    with pytest.raises(ValueError) as error:
+        compile_schema(schema)
+    assert str(error.value) == "unknown country codes: ['XX']"
+
+
+def test_generate_name_gamertag():
+    for _ in range(50):
+        tag = generate_name({"format": "gamertag"})
+        word = tag.rstrip("0123456789")
+        suffix = tag[len(word) :]
+        assert word in GAMERTAG_WORDS
+        assert suffix == "" or 1 <= int(suffix) <= 10
+
+
+def test_format_ipv6_matches_ipaddress():
+    for value in [
+        2**32,
+        2**128 - 1,
+        0x20010DB8000000000000000000000001,
+        0x20010DB8000000010000000000000001,
+        0x00010000000000000000000000000000,
+        0x20010DB8000000000001000000000000,
+    ]:
+        assert format_ipv6(value) == str(ipaddress.IPv6Address(value))
+
+
+@pytest.mark.parametrize("start_year, end_year", [(2020, 2022), (1, 9999)])
+def test_make_documents_trophy_shape_and_dates(start_year, end_year):
+    schema = {
+        "game": {"type": "game"},
+        "trophies": {
+            "type": "trophies",
+            "min": 1,
+            "max": 5,
+            "start_year": start_year,
+            "end_year": end_year,
+        },
+    }
+    documents = make_documents(schema, 300)
+
+    for document in documents:
+        assert 1 <= len(document["trophies"]) <= 5
+        for trophy in document["trophies"]:
+            assert list(trophy) == ["tournament", "placement"]
+            tournament, day = trophy["tournament"].rsplit(" ", 1)
+            assert tournament in GAMES[document["game"]]["tournaments"]
+            assert trophy["placement"] in PLACEMENTS
+            assert date.fromisoformat(day).isoformat() == day
+            assert start_year <= date.fromisoformat(day).year <= end_year
+
+
+def test_compile_schema_gamertag_type():
+    field_map, bad_types = process_fields({"tag": "gamertag"})
+    documents = make_documents(compile_schema(field_map), 50)
+
+    assert bad_types == []
+    for document in documents:
+        assert document["tag"].rstrip("0123456789") in GAMERTAG_WORDS
+
+
+def test_compile_schema_rejects_dob_before_year_one():
+    limit = date.today().year - 1
+    with pytest.raises(ValueError) as error:
+        compile_schema({"dob": {"type": "dob", "max": 3000}})
+    assert str(error.value) == f"dob max must be less than {limit}"
+
+    dob = make_documents({"dob": {"type": "dob", "max": limit - 1}}, 200)
+    assert all(date.fromisoformat(document["dob"]) for document in dob)
@@ -0,0 +1,80 @@
+import sys
+import os
+import json
+import pytest
+import random
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "../../")))
+
+import serializer
+from generators import compile_schema, make_documents, make_rows
+from serializer import RowTemplate, dumps, dumps_lines, dumps_sorted, stdlib_encode
+
+DOCUMENT = {
+    "name": "Zoë",
+    "id": 7,
+    "score": 2.5,
+    "active": True,
+    "org": None,
+    "trophies": [{"tournament": "IEM Katowice", "placement": "Winner"}],
+}
+
+
+def test_dumps_is_compact_utf8_and_matches_stdlib():
+    encoded = dumps(DOCUMENT)
+    assert json.loads(encoded) == DOCUMENT
+    assert encoded == stdlib_encode(DOCUMENT)
+    assert "Zoë".encode() in encoded
+    assert b", " not in encoded and b": " not in encoded
+
+
+def test_dumps_sorted_matches_jsonify_settings():
+    assert dumps_sorted(DOCUMENT).decode() == json.dumps(
+        DOCUMENT, separators=(",", ":"), sort_keys=True, ensure_ascii=False
+    )
+
+
+def test_dumps_lines():
+    assert dumps_lines([]) == b""
+    assert dumps_lines([{"a": 1}, {"b": 2}]) == b'{"a":1}\n{"b":2}\n'
+
+
+def test_dumps_falls_back_for_values_orjson_rejects():
+    assert dumps({"n": 2**70}) == b'{"n":1180591620717411303424}'
+    assert dumps({1: "x"}) == b'{"1":"x"}'
+
+
+def test_dumps_uses_default_like_json():
+    class Point:
+        pass
+
+    assert dumps({"p": Point()}, default=lambda obj: "point") == b'{"p":"point"}'
+    with pytest.raises(TypeError):
+        dumps({"p": Point()})
+
+
+@pytest.mark.parametrize("backend", ["orjson", "json"])
+def test_row_template_matches_dumps(monkeypatch, backend):
+    if backend == "json":
+        monkeypatch.setattr(serializer, "orjson", None)
+    plan = compile_schema(
+        {
+            "nickname": {"type": "name", "format": "gamertag"},
+            'odd "key" 100%': {"type": "integer"},
+            "game": {"type": "game"},
+            "role": {"type": "role", "custom": 5},
+            "country": {"type": "country", "format": "name"},
+            "trophies": {"type": "trophies", "max": 3},
+        }
+    )
+    rows = make_rows(plan, 300, random.Random(3))
+    documents = make_documents(plan, 300, random.Random(3))
+
+    assert plan.template().lines(rows) == [stdlib_encode(doc) for doc in documents]
+    assert plan.template(sort_keys=True).lines(rows) == [
+        stdlib_encode(doc, sort_keys=True) for doc in documents
+    ]
+
+
+def test_row_template_without_fields():
+    assert RowTemplate([]).lines([(), ()]) == [b"{}", b"{}"]
@@ -0,0 +1,141 @@
+import sys
+import os
+import threading
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "../../")))
+
+from spool import Spool
+import pytest
+
+
+def make_spool(path, **overrides):
+    settings = {"max_bytes": 1 << 20, "segment_bytes": 64, "fsync": "never"}
+    settings.update(overrides)
+    return Spool(str(path), **settings)
+
+
+def test_spool_returns_records_in_order(tmp_path):
+    spool = make_spool(tmp_path)
+    for i in range(5):
+        spool.put(b"body %d" % i, i)
+    records = [spool.get(timeout=0) for _ in range(5)]
+    assert [(body, docs) for _, body, docs in records] == [
+        (b"body %d" % i, i) for i in range(5)
+    ]
+    assert spool.get(timeout=0) is None
+
+
+def test_spool_replays_unacked_records_after_reopen(tmp_path):
+    spool = make_spool(tmp_path)
+    for i in range(6):
+        spool.put(b"body %d" % i, 1)
+    first = spool.get(timeout=0)
+    second = spool.get(timeout=0)
+    third = spool.get(timeout=0)
+    spool.ack(first[0])
+    spool.ack(third[0])  # out of order: the commit stops at the unacked second
+    spool.close()
+
+    spool = make_spool(tmp_path)
+    bodies = []
+    while (record := spool.get(timeout=0)) is not None:
+        bodies.append(record[1])
+    assert bodies == [b"body %d" % i for i in range(1, 6)]
+    assert second[1] == b"body 1"
+
+
+def test_spool_truncates_torn_tail(tmp_path):
+    spool = make_spool(tmp_path, segment_bytes=1 << 20)
+    spool.put(b"complete", 1)
+    spool.put(b"torn record", 1)
+    spool.close()
+    segment = next(p for p in tmp_path.iterdir() if p.suffix == ".seg")
+    os.truncate(segment, segment.stat().st_size - 3)
+
+    spool = make_spool(tmp_path, segment_bytes=1 << 20)
+    assert spool.get(timeout=0)[1] == b"complete"
+    assert spool.get(timeout=0) is None
+    spool.put(b"after", 1)
+    assert spool.get(timeout=0)[1] == b"after"
+
+
+def test_spool_deletes_acked_segments(tmp_path):
+    spool = make_spool(tmp_path)
+    for i in range(10):
+        spool.put(b"x" * 40, 1)
+    assert len(list(tmp_path.glob("*.seg"))) == 10
+    for _ in range(10):
+        spool.ack(spool.get(timeout=0)[0])
+    assert len(list(tmp_path.glob("*.seg"))) == 1
+
+
+def test_spool_put_blocks_until_acked(tmp_path):
+    spool = make_spool(tmp_path, max_bytes=100)
+    spool.put(b"x" * 60, 1)
+    done = threading.Event()
+    writer = threading.Thread(target=lambda: (spool.put(b"y" * 60, 1), done.set()))
+    writer.start()
+    assert not done.wait(0.1)
+
+    spool.ack(spool.get(timeout=0)[0])
+    assert done.wait(1)
+    writer.join()
+    assert spool.get(timeout=0)[1] == b"y" * 60
+
+
+def test_spool_rejects_unknown_fsync_policy(tmp_path):
+    with pytest.raises(ValueError):
+        make_spool(tmp_path, fsync="sometimes")
+
+
+def test_spool_ack_syncs_data_before_the_offset(tmp_path, monkeypatch):
+    spool = make_spool(tmp_path, fsync="interval", fsync_interval=3600)
+    spool.put(b"body", 1)
+    synced = []
+    monkeypatch.setattr(os, "fsync", lambda fd: synced.append(fd))
+
+    spool.ack(spool.get(timeout=0)[0])
+
+    assert synced[0] == spool.writer.fileno()
+    assert not spool.dirty
+
+
+def test_spool_clamps_offset_past_lost_data(tmp_path):
+    spool = make_spool(tmp_path, segment_bytes=1 << 20)
+    for i in range(3):
+        spool.put(b"record-%d" % i, 1)
+    for _ in range(3):
+        spool.ack(spool.get(timeout=0)[0])
+    ### power loss: the offset survived, most of the segment did not
+    segment = next(p for p in tmp_path.iterdir() if p.suffix == ".seg")
+    os.truncate(segment, 10)
+
+    spool = make_spool(tmp_path, segment_bytes=1 << 20)
+    assert spool.size == 0
+    assert spool.get(timeout=0) is None
+    spool.put(b"record-xyz", 1)
+    token, body, docs = spool.get(timeout=0)
+    assert (body, docs) == (b"record-xyz", 1)
+    spool.ack(token)
+    assert spool.size == 0
+
+
+def test_spool_get_skips_corrupt_records(tmp_path):
+    spool = make_spool(tmp_path, segment_bytes=1 << 20)
+    for i in range(3):
+        spool.put(b"record-%d" % i, 1)
+    segment = next(p for p in tmp_path.iterdir() if p.suffix == ".seg")
+    data = bytearray(segment.read_bytes())
+    data[data.index(b"record-1")] ^= 0xFF
+    segment.write_bytes(bytes(data))
+
+    first = spool.get(timeout=0)
+    assert first[1] == b"record-0"
+    assert spool.get(timeout=0) is None
+
+    spool.put(b"after", 1)
+    second = spool.get(timeout=0)
+    assert second[1] == b"after"
+    spool.ack(first[0])
+    spool.ack(second[0])
+    assert spool.size == 0